@@ -1,80 +1,28 @@
 """LangGraph agent implementation."""
-from typing import Dict, List, Literal, TypedDict, Annotated
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, List, Literal, Optional, TypedDict, Annotated
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.prebuilt import ToolNode
 import aiosqlite
-import sqlite3
 from langgraph_checkpoint_cosmosdb import CosmosDBSaver
 import os
 
-from langchain_core.messages.utils import (
-    trim_messages,
-    count_tokens_approximately
-)
-
 from .tools import AVAILABLE_TOOLS
 from .model import model
-from utils.langgraph_content import sanitize_and_validate_messages
+from utils.langgraph_content import get_text_from_contents, iter_sanitized_messages, trim_messages_to_token_limit
 from lib.tracing import get_microsoft_tracer
 from lib.langgraph import change_file_to_url
+from lib.database import SQLITE_PRAGMAS
+from lib.semantic_cache import semantic_cache
 
-class AgentState(TypedDict):
-    """State for the agent graph."""
-    messages: Annotated[List[BaseMessage], add_messages]
-
-
-def should_continue(state: AgentState) -> Literal["tools", "end"]:
-    """Determine whether to continue to tools or end the conversation.
-    
-    Args:
-        state: Current agent state
-        
-    Returns:
-        str: Next node to execute ("tools" or "end")
-    """
-    messages = state["messages"]
-    last_message = messages[-1]
-    
-    # If the LLM makes a tool call, then we route to the "tools" node
-    if hasattr(last_message, "tool_calls") and last_message.tool_calls:
-        return "tools"
-    # Otherwise, we stop (reply to the user)
-    return "end"
+logger = logging.getLogger(__name__)
 
 
-def call_model(state: AgentState, config = None) -> Dict[str, List[BaseMessage]]:
-    """Call the model with the current state.
-    
-    Args:
-        state: Current agent state
-        config: Configuration dictionary
-        
-    Returns:
-        Dict containing the updated messages
-    """
-    messages = state["messages"]
-
-    # Trim messages to fit within token limit
-    messages = trim_messages(
-        state["messages"],
-        strategy="last",
-        token_counter=count_tokens_approximately,
-        max_tokens=120_000,
-        start_on="human",
-        end_on=("human", "tool"),
-    )
-
-    # Sanitize and validate messages to ensure proper tool call/response pairing
-    messages = sanitize_and_validate_messages(messages)
-    
-    # Convert file://{id} URLs to temporary blob URLs with SAS tokens
-    messages = change_file_to_url(messages)
-
-    system_prompt = """
+SYSTEM_PROMPT = """
 # Your Role
 You are a helpful AI assistant. You must reason step by step, use multiple tools when needed, and continue iterating until the user’s request is fully satisfied.  
 
@@ -143,33 +91,170 @@ If you cannot find supporting documents: explicitly say "No matching documents f
   3. DO NOT compile the references at the end, just put them on the sentences where relevant.
   4. DO NOT USE MARKDOWN LINKS FOR REFERENCES, USE THE FORMAT [link-(url)] or [doc-(id)].
   5. DO NOT MAKE UP MATHEMATICAL INFORMATION, ALWAYS USE THE PYTHON_REPL TOOL FOR ANY MATHEMATICAL CALCULATIONS, FORMULAS, EQUATIONS, EXPRESSIONS, CONVERSIONS, OR ANYTHING RELATED TO MATH.
+"""
+
+# Built once at import; identical for every model call. It is always sent as
+# the first message so the provider's prompt cache can reuse the prefix.
+SYSTEM_MSG = SystemMessage(content=SYSTEM_PROMPT.strip())
+
+# Bind tools once at import instead of regenerating the tool schemas every turn
+MODEL_WITH_TOOLS = model.bind_tools(AVAILABLE_TOOLS)
+
+
+class AgentState(TypedDict):
+    """State for the agent graph."""
+    messages: Annotated[List[BaseMessage], add_messages]
+
+
+def should_continue(state: AgentState) -> Literal["tools", "end"]:
+    """Determine whether to continue to tools or end the conversation.
+    
+    Args:
+        state: Current agent state
+        
+    Returns:
+        str: Next node to execute ("tools" or "end")
+    """
+    messages = state["messages"]
+    last_message = messages[-1]
+    
+    # If the LLM makes a tool call, then we route to the "tools" node
+    if hasattr(last_message, "tool_calls") and last_message.tool_calls:
+        return "tools"
+    # Otherwise, we stop (reply to the user)
+    return "end"
+
+
+def call_model(state: AgentState, config = None) -> Dict[str, List[BaseMessage]]:
+    """Call the model with the current state.
+    
+    Args:
+        state: Current agent state
+        config: Configuration dictionary
+        
+    Returns:
+        Dict containing the updated messages
     """
+    # Trim messages to fit within token limit
+    messages = trim_messages_to_token_limit(state["messages"], max_tokens=120_000)
+
+    # Sanitize tool call/response pairing and convert file://{id} URLs to
+    # temporary blob URLs with SAS tokens in a single pass
+    messages = change_file_to_url(iter_sanitized_messages(messages))
 
-    system_msg = SystemMessage(content=system_prompt.strip())
-    messages = [system_msg] + messages
+    messages = [SYSTEM_MSG] + messages
         
-    # Bind tools to the model
-    model_with_tools = model.bind_tools(AVAILABLE_TOOLS)
-    response = model_with_tools.invoke(messages)
+    response = MODEL_WITH_TOOLS.invoke(messages)
     
     # Return the response
     return {"messages": [response]}
 
 
-# Initialize checkpointer
-## Using SQLITE checkpointer for simplicity
-db = sqlite3.connect("mock.db", check_same_thread=False)
-checkpointer = SqliteSaver(db)
+def get_cacheable_question(messages: List[BaseMessage]) -> Optional[str]:
+    """Get the question the semantic cache is keyed on, if the conversation has one.
+    
+    Only the opening, text-only question of a conversation is cached: later
+    turns depend on the earlier messages, and attachments are not part of
+    the embedding.
+    
+    Args:
+        messages: Current conversation messages
+        
+    Returns:
+        Optional[str]: The question text, or None if the cache does not apply
+    """
+    if not messages or not isinstance(messages[0], HumanMessage):
+        return None
+    if any(isinstance(message, HumanMessage) for message in messages[1:]):
+        return None
+    
+    content = messages[0].content
+    if isinstance(content, list) and any(not isinstance(part, dict) or part.get("type") != "text" for part in content):
+        return None
+    return get_text_from_contents(content).strip() or None
+
+
+def check_semantic_cache(state: AgentState, config = None) -> Dict[str, List[BaseMessage]]:
+    """Answer from the semantic cache when a near-identical question was already answered.
+    
+    Args:
+        state: Current agent state
+        config: Configuration dictionary, carrying the userid the cache is scoped to
+        
+    Returns:
+        Dict containing the cached answer, or no update on a miss
+    """
+    userid = (config or {}).get("configurable", {}).get("userid")
+    question = get_cacheable_question(state["messages"])
+    if userid and question:
+        try:
+            answer = semantic_cache.lookup(userid, question)
+        except Exception as e:
+            logger.warning("Semantic cache lookup failed: %s", e)
+            answer = None
+        if answer is not None:
+            return {"messages": [AIMessage(content=answer)]}
+    return {}
+
+
+def route_after_cache(state: AgentState) -> Literal["agent", "end"]:
+    """End on a cache hit, otherwise run the agent."""
+    if isinstance(state["messages"][-1], AIMessage):
+        return "end"
+    return "agent"
+
+
+def store_semantic_cache(state: AgentState, config = None) -> Dict[str, List[BaseMessage]]:
+    """Store the final answer of a cacheable conversation in the semantic cache.
+    
+    Args:
+        state: Current agent state
+        config: Configuration dictionary, carrying the userid the cache is scoped to
+        
+    Returns:
+        Empty dict, the state is not changed
+    """
+    userid = (config or {}).get("configurable", {}).get("userid")
+    question = get_cacheable_question(state["messages"])
+    answer = state["messages"][-1].content
+    if userid and question and isinstance(answer, str) and answer:
+        try:
+            semantic_cache.store(userid, question, answer)
+        except Exception as e:
+            logger.warning("Semantic cache store failed: %s", e)
+    return {}
+
+
+# Checkpoints live in the same SQLite file as the metadata tables
+CHECKPOINT_DB_PATH = "mock.db"
 
 # Create the graph
 workflow = StateGraph(AgentState)
 
 # Add nodes
 workflow.add_node("agent", call_model)
+# ToolNode already runs the tool calls of one AI message concurrently (a thread
+# pool on the sync path, asyncio.gather on the async path), so independent
+# searches take max(t) rather than sum(t).
 workflow.add_node("tools", ToolNode(AVAILABLE_TOOLS))
 
-# Set the entrypoint as agent
-workflow.set_entry_point("agent")
+if semantic_cache:
+    # Check the semantic cache before the agent and fill it after the final answer
+    workflow.add_node("cache_lookup", check_semantic_cache)
+    workflow.add_node("cache_store", store_semantic_cache)
+    workflow.set_entry_point("cache_lookup")
+    workflow.add_conditional_edges(
+        "cache_lookup",
+        route_after_cache,
+        {
+            "agent": "agent",
+            "end": END,
+        },
+    )
+    workflow.add_edge("cache_store", END)
+else:
+    # Set the entrypoint as agent
+    workflow.set_entry_point("agent")
 
 # Add conditional edges
 workflow.add_conditional_edges(
@@ -177,7 +262,7 @@ workflow.add_conditional_edges(
     should_continue,
     {
         "tools": "tools",
-        "end": END,
+        "end": "cache_store" if semantic_cache else END,
     },
 )
 
@@ -186,7 +271,28 @@ workflow.add_edge("tools", "agent")
 
 tracers = get_microsoft_tracer()
 
-# Compile the graph
-graph = workflow.compile(checkpointer=checkpointer).with_config(
+# Compile the graph. The checkpointer is attached by checkpointer_lifespan()
+# because AsyncSqliteSaver must be created inside the running event loop.
+graph = workflow.compile().with_config(
     {"recursion_limit": 100, "callbacks": tracers}
-)
\ No newline at end of file
+)
+
+
+@asynccontextmanager
+async def checkpointer_lifespan():
+    """Open the async SQLite checkpointer and attach it to the graph.
+    
+    Checkpoint writes go through aiosqlite's worker thread, so they no longer
+    block the event loop. The connection uses the same WAL pragmas as the
+    metadata database.
+    """
+    async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB_PATH) as checkpointer:
+        for pragma in SQLITE_PRAGMAS:
+            await checkpointer.conn.execute(pragma)
+        await checkpointer.setup()
+        
+        graph.checkpointer = checkpointer
+        try:
+            yield checkpointer
+        finally:
+            graph.checkpointer = None
\ No newline at end of file
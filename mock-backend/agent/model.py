@@ -7,6 +7,11 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Optional routing hint for Azure OpenAI prompt caching. Requests sharing a key
+# are sent to the same cache, so the static system prompt + tool schema prefix
+# is reused instead of being prefilled again on every agent step.
+PROMPT_CACHE_KEY = os.getenv("AZURE_OPENAI_PROMPT_CACHE_KEY")
+
 
 def create_azure_model(**kwargs) -> AzureChatOpenAI:
     """Create an Azure OpenAI model instance.
@@ -17,6 +22,10 @@ def create_azure_model(**kwargs) -> AzureChatOpenAI:
     Returns:
         AzureChatOpenAI: Configured Azure OpenAI model
     """
+    if PROMPT_CACHE_KEY:
+        model_kwargs = kwargs.setdefault("model_kwargs", {})
+        model_kwargs.setdefault("prompt_cache_key", PROMPT_CACHE_KEY)
+
     llm = AzureChatOpenAI(
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
@@ -22,6 +22,10 @@ Environment Variables Required:
 - AZURE_OPENAI_EMBEDDING_MODEL: Embedding model name (optional, defaults to 'text-embedding-ada-002')
 """
 import os
+import time
+import threading
+import functools
+from collections import OrderedDict
 from datetime import datetime
 from langchain_core.tools import tool
 from langchain_azure_dynamic_sessions import SessionsPythonREPLTool
@@ -36,6 +40,46 @@ load_dotenv()
 
 tool_generator = []
 
+# Seconds a search result is reused for identical tool arguments (0 disables)
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", "300"))
+TOOL_CACHE_MAX_SIZE = 1024
+
+
+def cached_tool_results(func):
+    """Reuse the result of a read-only tool for identical arguments for TOOL_CACHE_TTL seconds.
+    
+    The agent often repeats the same search within and across turns. Caching
+    at the tool level keeps the tool_call_id pairing of the ToolMessages
+    intact, which a cached graph node would replay from the earlier call.
+    Error results are not cached, so a failed search is retried.
+    """
+    if TOOL_CACHE_TTL <= 0:
+        return func
+    
+    cache: "OrderedDict[tuple, tuple[str, float]]" = OrderedDict()
+    lock = threading.Lock()
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with lock:
+            entry = cache.get(key)
+            if entry is not None and entry[1] > now:
+                cache.move_to_end(key)
+                return entry[0]
+        
+        result = func(*args, **kwargs)
+        if not result.startswith("Error "):
+            with lock:
+                cache[key] = (result, now + TOOL_CACHE_TTL)
+                cache.move_to_end(key)
+                if len(cache) > TOOL_CACHE_MAX_SIZE:
+                    cache.popitem(last=False)
+        return result
+    
+    return wrapper
+
 @tool
 def get_current_time() -> str:
     """Get the current date and time.
@@ -57,6 +101,7 @@ if os.getenv("SEARXNG_URL"):
     search = SearxSearchWrapper(searx_host=os.getenv("SEARXNG_URL"))
 
     @tool
+    @cached_tool_results
     def web_search(query: str) -> str:
         """Perform a web search using SearxNG.
         
@@ -99,6 +144,7 @@ if (os.getenv("AZURE_SEARCH_ENDPOINT") and
     )
 
     @tool
+    @cached_tool_results
     def azure_search_documents(query: str, top: int = 5) -> str:
         """Search documents in Azure AI Search using text-based search.
         
@@ -151,6 +197,7 @@ if (os.getenv("AZURE_SEARCH_ENDPOINT") and
     tool_generator.append(azure_search_documents)
 
     @tool
+    @cached_tool_results
     def azure_search_semantic(query: str, top: int = 5) -> str:
         """Search documents in Azure AI Search using semantic search capabilities.
         
@@ -216,6 +263,7 @@ if (os.getenv("AZURE_SEARCH_ENDPOINT") and
     tool_generator.append(azure_search_semantic)
 
     @tool
+    @cached_tool_results
     def azure_search_filter(query: str, filter_expression: str, top: int = 5) -> str:
         """Search documents in Azure AI Search with OData filter expressions.
         
@@ -281,6 +329,7 @@ if (os.getenv("AZURE_SEARCH_ENDPOINT") and
             )
             
             @tool
+            @cached_tool_results
             def azure_search_vector(query: str, top: int = 5) -> str:
                 """Search documents in Azure AI Search using vector similarity.
                 
@@ -2,7 +2,7 @@
 import os
 import secrets
 from typing import Annotated
-from fastapi import HTTPException, Depends, status
+from fastapi import HTTPException, Depends, Header, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from dotenv import load_dotenv
 
@@ -16,11 +16,18 @@ security = HTTPBasic()
 BACKEND_AUTH_USERNAME = os.getenv("BACKEND_AUTH_USERNAME", "apiuser")
 BACKEND_AUTH_PASSWORD = os.getenv("BACKEND_AUTH_PASSWORD", "securepass123")
 
+# Encoded once instead of on every request
+_USERNAME_BYTES = BACKEND_AUTH_USERNAME.encode("utf-8")
+_PASSWORD_BYTES = BACKEND_AUTH_PASSWORD.encode("utf-8")
 
-def verify_credentials(credentials: Annotated[HTTPBasicCredentials, Depends(security)]) -> str:
+
+async def verify_credentials(credentials: Annotated[HTTPBasicCredentials, Depends(security)]) -> str:
     """
     Verify HTTP Basic Auth credentials.
     
+    Declared async (it never blocks) so FastAPI calls it on the event loop
+    instead of dispatching it to the threadpool on every request.
+    
     Args:
         credentials: HTTP Basic Auth credentials
         
@@ -33,11 +40,11 @@ def verify_credentials(credentials: Annotated[HTTPBasicCredentials, Depends(secu
     # Use secrets.compare_digest to prevent timing attacks
     is_correct_username = secrets.compare_digest(
         credentials.username.encode("utf-8"), 
-        BACKEND_AUTH_USERNAME.encode("utf-8")
+        _USERNAME_BYTES
     )
     is_correct_password = secrets.compare_digest(
         credentials.password.encode("utf-8"), 
-        BACKEND_AUTH_PASSWORD.encode("utf-8")
+        _PASSWORD_BYTES
     )
     
     if not (is_correct_username and is_correct_password):
@@ -47,4 +54,20 @@ def verify_credentials(credentials: Annotated[HTTPBasicCredentials, Depends(secu
             headers={"WWW-Authenticate": "Basic"},
         )
     
-    return credentials.username
\ No newline at end of file
+    return credentials.username
+
+
+def _userid_dependency(status_code: int, detail: str):
+    """Build a dependency that requires the userid header, answering a missing one with status_code."""
+    async def require(userid: str | None = Header(None)) -> str:
+        if not userid:
+            raise HTTPException(status_code=status_code, detail=detail)
+        return userid
+    return require
+
+
+# Require the userid header. The attachment routes answer a missing one with 401
+require_userid = _userid_dependency(status.HTTP_401_UNAUTHORIZED, "userid header is required")
+
+# The chat, file and chunk routes have always answered a missing userid with 400
+require_userid_400 = _userid_dependency(status.HTTP_400_BAD_REQUEST, "Missing userid header")
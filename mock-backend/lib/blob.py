@@ -1,24 +1,68 @@
 """Azure Blob Storage operations."""
 import os
-from datetime import datetime, timedelta
-from typing import BinaryIO
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Dict, Iterable, Optional, Tuple
+from urllib.parse import quote
 from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
 
+# Signed URLs by blob name as (url, expires_at). Clients refetch the same
+# attachments, so a URL is handed out again while at least half of the
+# requested lifetime is left instead of signing a new one on every call.
+_SAS_URL_CACHE: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+_SAS_URL_CACHE_MAX_SIZE = 10_000
+_sas_url_lock = threading.Lock()
 
+
+def _get_cached_links(blob_names: Iterable[str], expiry: int) -> Dict[str, str]:
+    """Get the cached SAS URLs that are still valid for at least half of expiry."""
+    min_expires_at = time.time() + expiry / 2
+    links = {}
+    with _sas_url_lock:
+        for blob_name in blob_names:
+            cached = _SAS_URL_CACHE.get(blob_name)
+            if cached and cached[1] >= min_expires_at:
+                links[blob_name] = cached[0]
+                _SAS_URL_CACHE.move_to_end(blob_name)
+    return links
+
+
+def _cache_links(links: Dict[str, str], expires_at: float):
+    """Store freshly signed SAS URLs, evicting the least recently used ones."""
+    with _sas_url_lock:
+        for blob_name, url in links.items():
+            _SAS_URL_CACHE[blob_name] = (url, expires_at)
+            _SAS_URL_CACHE.move_to_end(blob_name)
+        while len(_SAS_URL_CACHE) > _SAS_URL_CACHE_MAX_SIZE:
+            _SAS_URL_CACHE.popitem(last=False)
+
+
+@lru_cache(maxsize=1)
 def get_blob_service_client() -> BlobServiceClient:
-    """Get Azure Blob Service client."""
+    """Get Azure Blob Service client.
+    
+    One client is shared by all callers so its HTTP connection pool is
+    reused; BlobServiceClient is safe to share across threads.
+    """
     return BlobServiceClient.from_connection_string(
         os.getenv("AZURE_STORAGE_CONNECTION_STRING")
     )
 
 
-def upload_file_to_blob(file: BinaryIO, blob_name: str) -> str:
+def upload_file_to_blob(file: BinaryIO, blob_name: str, length: Optional[int] = None) -> str:
     """
     Upload a file to Azure Blob Storage.
     
+    File objects are streamed to storage in chunks rather than read into
+    memory first.
+    
     Args:
-        file: File object to upload
+        file: File object (or bytes) to upload
         blob_name: Name for the blob in storage
+        length: Size of the upload in bytes, if known
         
     Returns:
         str: The blob name
@@ -32,7 +76,7 @@ def upload_file_to_blob(file: BinaryIO, blob_name: str) -> str:
     )
     
     # Upload the file
-    blob_client.upload_blob(file, overwrite=True)
+    blob_client.upload_blob(file, length=length, overwrite=True)
     
     return blob_name
 
@@ -58,10 +102,33 @@ def get_file_link(blob_name: str) -> str:
     return blob_client.url
 
 
+@lru_cache(maxsize=1)
+def _get_sas_settings() -> Tuple[str, str, str, str]:
+    """
+    Get what SAS signing needs, read once instead of on every link.
+    
+    Returns:
+        Tuple[str, str, str, str]: Account name, account key, container name
+        and the container URL prefix for blob URLs
+    """
+    blob_service_client = get_blob_service_client()
+    container_name = os.getenv("AZURE_STORAGE_CONTAINER_NAME")
+    container_url = blob_service_client.get_container_client(container_name).url
+    return (
+        blob_service_client.account_name,
+        blob_service_client.credential.account_key,
+        container_name,
+        f"{container_url}/"
+    )
+
+
 def get_file_temporary_link(blob_name: str, expiry: int = 3600) -> str:
     """
     Get a temporary link to a blob with SAS token.
     
+    A link signed earlier for the same blob is reused while it is still
+    valid for at least half of the requested expiry.
+    
     Args:
         blob_name: Name of the blob
         expiry: Expiry time in seconds (default: 1 hour)
@@ -69,26 +136,50 @@ def get_file_temporary_link(blob_name: str, expiry: int = 3600) -> str:
     Returns:
         str: URL with SAS token
     """
-    blob_service_client = get_blob_service_client()
-    container_name = os.getenv("AZURE_STORAGE_CONTAINER_NAME")
+    return get_file_temporary_links([blob_name], expiry)[blob_name]
+
+
+def get_file_temporary_links(blob_names: Iterable[str], expiry: int = 3600) -> Dict[str, str]:
+    """
+    Get temporary links for several blobs at once.
     
-    blob_client = blob_service_client.get_blob_client(
-        container=container_name, 
-        blob=blob_name
-    )
+    SAS tokens are signed locally with one expiry time for the batch. Links
+    that were signed recently are reused from the cache.
     
-    # Generate SAS token
-    sas_token = generate_blob_sas(
-        account_name=blob_service_client.account_name,
-        container_name=container_name,
-        blob_name=blob_name,
-        account_key=blob_service_client.credential.account_key,
-        permission=BlobSasPermissions(read=True),
-        expiry=datetime.utcnow() + timedelta(seconds=expiry)
-    )
+    Args:
+        blob_names: Names of the blobs
+        expiry: Expiry time in seconds (default: 1 hour)
+        
+    Returns:
+        Dict[str, str]: URL with SAS token for each blob name
+    """
+    blob_names = set(blob_names)
+    links = _get_cached_links(blob_names, expiry)
+    blob_names -= links.keys()
+    if not blob_names:
+        return links
+    
+    account_name, account_key, container_name, url_prefix = _get_sas_settings()
+    expires_at = time.time() + expiry
+    expiry_time = datetime.now(timezone.utc) + timedelta(seconds=expiry)
+    permission = BlobSasPermissions(read=True)
     
-    # Construct URL with SAS token
-    return f"{blob_client.url}?{sas_token}"
+    signed = {}
+    for blob_name in blob_names:
+        sas_token = generate_blob_sas(
+            account_name=account_name,
+            container_name=container_name,
+            blob_name=blob_name,
+            account_key=account_key,
+            permission=permission,
+            expiry=expiry_time
+        )
+        # Same encoding of the blob name as BlobClient.url
+        signed[blob_name] = f"{url_prefix}{quote(blob_name, safe='~/')}?{sas_token}"
+    
+    _cache_links(signed, expires_at)
+    links.update(signed)
+    return links
 
 
 def delete_file(blob_name: str) -> bool:
@@ -111,4 +202,7 @@ def delete_file(blob_name: str) -> bool:
     
     blob_client.delete_blob()
     
+    with _sas_url_lock:
+        _SAS_URL_CACHE.pop(blob_name, None)
+    
     return True
\ No newline at end of file
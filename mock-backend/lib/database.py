@@ -1,10 +1,211 @@
 """Database models and operations for conversation metadata."""
+import asyncio
+import json
+import queue
 import sqlite3
+import threading
 import time
-from typing import List, Optional, Dict, Any
-from contextlib import contextmanager
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+from contextlib import asynccontextmanager, contextmanager
 from dataclasses import dataclass
 
+import aiosqlite
+
+
+# Applied to every connection opened by DatabaseManager. page_size only takes
+# effect on a new, empty file (before WAL is enabled) and is a no-op otherwise.
+SQLITE_PRAGMAS = (
+    "PRAGMA page_size=8192",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA mmap_size=268435456",
+)
+
+
+# Bump when init_db gains a schema change; older files are migrated on start
+SCHEMA_VERSION = 2
+
+
+# SQL statements are module-level constants so every call sends the exact
+# same text and hits the per-connection statement cache. Timestamps are
+# computed by SQLite (unixepoch()) and read back with RETURNING; the *_AT
+# variants take an explicit timestamp for bulk inserts sharing one.
+_SQL_NOW = "SELECT unixepoch()"
+# Listing queries end in LIMIT ? OFFSET ?; a limit of -1 means no limit
+_NO_LIMIT = -1
+_SQL_INSERT_CONVERSATION = """
+    INSERT INTO conversations (id, userid, title, is_pinned, last_used_at)
+    VALUES (?, ?, ?, ?, unixepoch())
+    RETURNING last_used_at
+"""
+_SQL_GET_CONVERSATION = """
+    SELECT id, userid, title, is_pinned, last_used_at
+    FROM conversations
+    WHERE id = ? AND userid = ?
+"""
+_SQL_GET_USER_CONVERSATIONS = """
+    SELECT id, userid, title, is_pinned, last_used_at
+    FROM conversations
+    WHERE userid = ?
+    ORDER BY last_used_at DESC
+    LIMIT ? OFFSET ?
+"""
+_SQL_LIST_USER_CONVERSATIONS = """
+    SELECT id, title, last_used_at, is_pinned
+    FROM conversations
+    WHERE userid = ?
+    ORDER BY last_used_at DESC
+    LIMIT ? OFFSET ?
+"""
+_SQL_GET_LAST_CONVERSATION = """
+    SELECT id, userid, title, is_pinned, last_used_at
+    FROM conversations
+    WHERE userid = ?
+    ORDER BY last_used_at DESC
+    LIMIT 1
+"""
+_SQL_GET_LAST_CONVERSATION_ID = """
+    SELECT id
+    FROM conversations
+    WHERE userid = ?
+    ORDER BY last_used_at DESC
+    LIMIT 1
+"""
+_SQL_PIN_CONVERSATION = """
+    UPDATE conversations
+    SET is_pinned = ?
+    WHERE id = ? AND userid = ?
+"""
+_SQL_UPDATE_CONVERSATION_TITLE = """
+    UPDATE conversations
+    SET title = ?
+    WHERE id = ? AND userid = ?
+"""
+_SQL_UPDATE_CONVERSATION_LAST_USED = """
+    UPDATE conversations
+    SET last_used_at = unixepoch()
+    WHERE id = ? AND userid = ?
+"""
+_SQL_DELETE_CONVERSATION = """
+    DELETE FROM conversations
+    WHERE id = ? AND userid = ?
+"""
+_SQL_CONVERSATION_EXISTS = """
+    SELECT EXISTS(
+        SELECT 1 FROM conversations
+        WHERE id = ? AND userid = ?
+    )
+"""
+_SQL_INSERT_FILE = """
+    INSERT INTO files (file_id, userid, filename, blob_name, status, uploaded_at, workflow_id)
+    VALUES (?, ?, ?, ?, ?, unixepoch(), ?)
+    RETURNING uploaded_at
+"""
+_SQL_INSERT_FILE_AT = """
+    INSERT INTO files (file_id, userid, filename, blob_name, status, uploaded_at, workflow_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+_SQL_GET_FILE = """
+    SELECT file_id, userid, filename, blob_name, status, uploaded_at, indexed_at, error_message, workflow_id
+    FROM files
+    WHERE file_id = ?
+"""
+_SQL_GET_FILES_BY_IDS = """
+    SELECT file_id, userid, filename, blob_name, status, uploaded_at, indexed_at, error_message, workflow_id
+    FROM files
+    WHERE file_id IN (SELECT value FROM json_each(?))
+"""
+_SQL_GET_USER_FILES = """
+    SELECT file_id, userid, filename, blob_name, status, uploaded_at, indexed_at, error_message, workflow_id
+    FROM files
+    WHERE userid = ?
+    ORDER BY uploaded_at DESC
+    LIMIT ? OFFSET ?
+"""
+_SQL_UPDATE_FILE_STATUS = """
+    UPDATE files
+    SET status = ?1, indexed_at = CASE WHEN ?1 = 'completed' THEN unixepoch() END, error_message = ?2
+    WHERE file_id = ?3
+"""
+_SQL_UPDATE_FILE_WORKFLOW_ID = """
+    UPDATE files
+    SET workflow_id = ?
+    WHERE file_id = ?
+"""
+_SQL_DELETE_FILE = """
+    DELETE FROM files
+    WHERE file_id = ? AND userid = ?
+"""
+_SQL_FILE_EXISTS = """
+    SELECT EXISTS(
+        SELECT 1 FROM files
+        WHERE file_id = ?
+    )
+"""
+_SQL_INSERT_ATTACHMENT = """
+    INSERT INTO attachments (id, userid, filename, blob_name, type, metadata, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, unixepoch())
+    RETURNING created_at
+"""
+_SQL_INSERT_ATTACHMENT_AT = """
+    INSERT INTO attachments (id, userid, filename, blob_name, type, metadata, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+_SQL_GET_ATTACHMENT = """
+    SELECT id, userid, filename, blob_name, type, metadata, created_at
+    FROM attachments
+    WHERE id = ?
+"""
+# The ids are bound as one JSON array so the statement text stays constant
+# regardless of how many ids are looked up
+_SQL_GET_ATTACHMENTS_BY_IDS = """
+    SELECT id, userid, filename, blob_name, type, metadata, created_at
+    FROM attachments
+    WHERE id IN (SELECT value FROM json_each(?))
+"""
+_SQL_GET_USER_ATTACHMENTS = """
+    SELECT id, userid, filename, blob_name, type, metadata, created_at
+    FROM attachments
+    WHERE userid = ?
+    ORDER BY created_at DESC
+"""
+_SQL_LIST_USER_ATTACHMENTS = """
+    SELECT id, filename, created_at, type, metadata, 'file://' || id AS url
+    FROM attachments
+    WHERE userid = ?
+    ORDER BY created_at DESC
+"""
+_SQL_UPDATE_ATTACHMENT_METADATA = """
+    UPDATE attachments
+    SET metadata = ?
+    WHERE id = ?
+"""
+_SQL_UPDATE_ATTACHMENT_METADATA_RETURNING = """
+    UPDATE attachments
+    SET metadata = ?
+    WHERE id = ?
+    RETURNING id, userid, filename, blob_name, type, metadata, created_at
+"""
+_SQL_UPDATE_ATTACHMENT_TYPE = """
+    UPDATE attachments
+    SET type = ?
+    WHERE id = ?
+"""
+_SQL_DELETE_ATTACHMENT = """
+    DELETE FROM attachments
+    WHERE id = ?
+"""
+_SQL_ATTACHMENT_EXISTS = """
+    SELECT EXISTS(
+        SELECT 1 FROM attachments
+        WHERE id = ?
+    )
+"""
+
 
 @dataclass
 class ConversationMetadata:
@@ -41,49 +242,185 @@ class Attachment:
     metadata: Optional[Dict[str, Any]] = None  # JSON metadata
 
 
+# The row converters unpack by position, so they rely on the column order of
+# the _SQL_GET_* statements above (which matches the dataclass field order
+# except for attachments, whose metadata comes before created_at).
+def _conversation_from_row(row: sqlite3.Row) -> ConversationMetadata:
+    """Build a ConversationMetadata from a conversations row."""
+    id, userid, title, is_pinned, last_used_at = row
+    return ConversationMetadata(id, userid, title, bool(is_pinned), last_used_at)
+
+
+def _file_from_row(row: sqlite3.Row) -> FileMetadata:
+    """Build a FileMetadata from a files row."""
+    return FileMetadata(*row)
+
+
+def _attachment_from_row(row: sqlite3.Row) -> Attachment:
+    """Build an Attachment from an attachments row, decoding the JSON metadata."""
+    id, userid, filename, blob_name, type, metadata, created_at = row
+    return Attachment(id, userid, filename, blob_name, type, created_at, json.loads(metadata) if metadata else None)
+
+
+class _AttachmentCache:
+    """Bounded, thread-safe LRU of Attachment rows keyed by ID.
+    
+    Entries expire after ttl seconds so rows changed by another process are
+    not served forever; writes made through this process drop their entry.
+    """
+    
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Attachment, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get_many(self, attachment_ids: Iterable[str]) -> Dict[str, Attachment]:
+        """Return the cached, unexpired attachments among the given IDs."""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for attachment_id in attachment_ids:
+                entry = self._entries.get(attachment_id)
+                if entry is None:
+                    continue
+                if entry[1] <= now:
+                    del self._entries[attachment_id]
+                    continue
+                found[attachment_id] = entry[0]
+                self._entries.move_to_end(attachment_id)
+        return found
+    
+    def put_many(self, attachments: Iterable[Attachment]) -> None:
+        """Cache attachments freshly read from the database."""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for attachment in attachments:
+                self._entries[attachment.id] = (attachment, expires_at)
+                self._entries.move_to_end(attachment.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def pop(self, attachment_id: str) -> None:
+        """Drop an attachment after it was updated or deleted."""
+        with self._lock:
+            self._entries.pop(attachment_id, None)
+
+
+# Shared by both managers so a write through either one invalidates reads
+# through the other. Chat turns look up the same attachments on every call.
+_attachment_cache = _AttachmentCache()
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> set:
+    """Return the column names of a table."""
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
 class DatabaseManager:
     """Database manager for conversation metadata."""
     
-    def __init__(self, db_path: str = "mock.db"):
+    def __init__(self, db_path: str = "mock.db", read_pool_size: int = 4):
         self.db_path = db_path
+        
+        # One long-lived writer connection, serialized by a lock
+        self._write_lock = threading.RLock()
+        self._write_conn = self._connect()
+        
+        # Small pool of reader connections; WAL lets them run alongside the writer.
+        # LIFO hands out the most recently used connection, whose page cache
+        # and prepared statements are the warmest.
+        self._read_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=read_pool_size)
+        for _ in range(read_pool_size):
+            self._read_pool.put(self._connect())
+        
         self.init_db()
     
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection configured with the shared pragmas."""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
     @contextmanager
     def get_connection(self):
-        """Get database connection with context manager."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Enable column access by name
+        """Get the shared writer connection with context manager."""
+        with self._write_lock:
+            yield self._write_conn
+    
+    @contextmanager
+    def get_read_connection(self):
+        """Borrow a reader connection from the pool with context manager."""
+        conn = self._read_pool.get()
         try:
             yield conn
         finally:
-            conn.close()
+            self._read_pool.put(conn)
     
-    def init_db(self):
-        """Initialize the database with the required schema."""
+    @contextmanager
+    def transaction(self):
+        """Run several writes in a single BEGIN IMMEDIATE/COMMIT on the writer connection."""
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn.cursor()
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+    
+    def optimize(self):
+        """Let SQLite refresh planner statistics for the queries run so far."""
         with self.get_connection() as conn:
+            conn.execute("PRAGMA optimize")
+    
+    def close(self):
+        """Close the writer and all pooled reader connections."""
+        with self._write_lock:
+            self._write_conn.execute("PRAGMA optimize")
+            self._write_conn.close()
+        while not self._read_pool.empty():
+            self._read_pool.get_nowait().close()
+    
+    def init_db(self):
+        """Initialize the database with the required schema.
+        
+        The schema version is stored in PRAGMA user_version, so the DDL and the
+        legacy column migrations below only run (in one transaction) when the
+        file is older than SCHEMA_VERSION, not on every start.
+        """
+        with self.get_read_connection() as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+                return
+        
+        with self.transaction() as conn:
+            # Another process may have migrated while we waited for the write lock
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+                return
+            
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS conversations (
                     id TEXT PRIMARY KEY,
                     userid TEXT NOT NULL,
                     title TEXT NOT NULL DEFAULT 'New Conversation',
-                    is_pinned BOOLEAN DEFAULT FALSE,
+                    is_pinned INTEGER NOT NULL DEFAULT 0 CHECK (is_pinned IN (0, 1)),
                     last_used_at INTEGER NOT NULL
                 )
             """)
             
-            # Add title column if it doesn't exist (for existing databases)
-            try:
+            # Add title column and rename created_at to last_used_at for existing databases
+            columns = _table_columns(conn, "conversations")
+            if "title" not in columns:
                 conn.execute("ALTER TABLE conversations ADD COLUMN title TEXT NOT NULL DEFAULT 'New Conversation'")
-            except sqlite3.OperationalError:
-                # Column already exists
-                pass
-            
-            # Rename created_at to last_used_at for existing databases
-            try:
+            if "created_at" in columns and "last_used_at" not in columns:
                 conn.execute("ALTER TABLE conversations RENAME COLUMN created_at TO last_used_at")
-            except sqlite3.OperationalError:
-                # Column might already be renamed or doesn't exist
-                pass
             
             # Create files table
             conn.execute("""
@@ -101,29 +438,27 @@ class DatabaseManager:
             """)
             
             # Add workflow_id column if it doesn't exist (for existing databases)
-            try:
+            if "workflow_id" not in _table_columns(conn, "files"):
                 conn.execute("ALTER TABLE files ADD COLUMN workflow_id TEXT")
-            except sqlite3.OperationalError:
-                # Column already exists
-                pass
-            
-            # Create index for faster queries by userid
-            conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_conversations_userid 
-                ON conversations(userid)
-            """)
             
-            # Create index for userid and last_used_at for ordering
+            # Create covering index for conversation listings: it holds every
+            # column they select, so they never read the table itself. It also
+            # serves the userid-only lookups, so the older indexes are dropped.
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_conversations_userid_last_used_at 
-                ON conversations(userid, last_used_at DESC)
+                CREATE INDEX IF NOT EXISTS idx_conversations_userid_last_used_at_cover 
+                ON conversations(userid, last_used_at DESC, id, title, is_pinned)
             """)
+            conn.execute("DROP INDEX IF EXISTS idx_conversations_userid")
+            conn.execute("DROP INDEX IF EXISTS idx_conversations_userid_last_used_at")
             
-            # Create index for files by userid
+            # Create index for files by userid and uploaded_at for ordering.
+            # It covers the userid-only lookups too, so the old single-column
+            # index is dropped.
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_files_userid 
-                ON files(userid)
+                CREATE INDEX IF NOT EXISTS idx_files_userid_uploaded_at 
+                ON files(userid, uploaded_at DESC)
             """)
+            conn.execute("DROP INDEX IF EXISTS idx_files_userid")
             
             # Create index for files by status
             conn.execute("""
@@ -144,43 +479,28 @@ class DatabaseManager:
                 )
             """)
             
-            # Create index for attachments by userid
-            conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_attachments_userid 
-                ON attachments(userid)
-            """)
-            
-            # Create index for attachments by created_at for ordering
+            # Create index for attachments by userid and created_at for ordering.
+            # It replaces the old single-column userid and created_at indexes.
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_attachments_created_at 
-                ON attachments(created_at DESC)
+                CREATE INDEX IF NOT EXISTS idx_attachments_userid_created_at 
+                ON attachments(userid, created_at DESC)
             """)
+            conn.execute("DROP INDEX IF EXISTS idx_attachments_userid")
+            conn.execute("DROP INDEX IF EXISTS idx_attachments_created_at")
             
             # Add type and metadata columns if they don't exist (for existing databases)
-            try:
+            columns = _table_columns(conn, "attachments")
+            if "type" not in columns:
                 conn.execute("ALTER TABLE attachments ADD COLUMN type TEXT NOT NULL DEFAULT 'unknown'")
-            except sqlite3.OperationalError:
-                # Column already exists
-                pass
-            
-            try:
+            if "metadata" not in columns:
                 conn.execute("ALTER TABLE attachments ADD COLUMN metadata TEXT")
-            except sqlite3.OperationalError:
-                # Column already exists
-                pass
             
-            conn.commit()
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     
     def create_conversation(self, conversation_id: str, userid: str, title: str = "New Conversation") -> ConversationMetadata:
         """Create a new conversation metadata entry."""
-        last_used_at = int(time.time())
-        
         with self.get_connection() as conn:
-            conn.execute("""
-                INSERT INTO conversations (id, userid, title, is_pinned, last_used_at)
-                VALUES (?, ?, ?, ?, ?)
-            """, (conversation_id, userid, title, False, last_used_at))
-            conn.commit()
+            last_used_at = conn.execute(_SQL_INSERT_CONVERSATION, (conversation_id, userid, title, False)).fetchone()[0]
         
         return ConversationMetadata(
             id=conversation_id,
@@ -192,65 +512,54 @@ class DatabaseManager:
     
     def get_conversation(self, conversation_id: str, userid: str) -> Optional[ConversationMetadata]:
         """Get conversation metadata by ID and userid."""
-        with self.get_connection() as conn:
-            row = conn.execute("""
-                SELECT id, userid, title, is_pinned, last_used_at 
-                FROM conversations 
-                WHERE id = ? AND userid = ?
-            """, (conversation_id, userid)).fetchone()
+        with self.get_read_connection() as conn:
+            row = conn.execute(_SQL_GET_CONVERSATION, (conversation_id, userid)).fetchone()
             
             if row:
-                return ConversationMetadata(
-                    id=row['id'],
-                    userid=row['userid'],
-                    title=row['title'],
-                    is_pinned=bool(row['is_pinned']),
-                    last_used_at=row['last_used_at']
-                )
+                return _conversation_from_row(row)
         return None
     
-    def get_user_conversations(self, userid: str) -> List[ConversationMetadata]:
-        """Get all conversations for a user, ordered by last_used_at descending."""
-        with self.get_connection() as conn:
-            rows = conn.execute("""
-                SELECT id, userid, title, is_pinned, last_used_at 
-                FROM conversations 
-                WHERE userid = ? 
-                ORDER BY last_used_at DESC
-            """, (userid,)).fetchall()
+    def get_user_conversations(self, userid: str, limit: Optional[int] = None, offset: int = 0) -> List[ConversationMetadata]:
+        """Get a user's conversations, ordered by last_used_at descending.
+        
+        Pass limit/offset to fetch one page instead of the whole history.
+        """
+        with self.get_read_connection() as conn:
+            rows = conn.execute(_SQL_GET_USER_CONVERSATIONS, (userid, _NO_LIMIT if limit is None else limit, offset)).fetchall()
             
-            return [
-                ConversationMetadata(
-                    id=row['id'],
-                    userid=row['userid'],
-                    title=row['title'],
-                    is_pinned=bool(row['is_pinned']),
-                    last_used_at=row['last_used_at']
-                )
-                for row in rows
-            ]
+            return [_conversation_from_row(row) for row in rows]
+    
+    def get_user_conversations_raw(self, userid: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """Get a user's conversation listing as plain dicts, ready for JSON serialization.
+        
+        Each dict has id, title, last_used_at and is_pinned.
+        """
+        with self.get_read_connection() as conn:
+            rows = conn.execute(_SQL_LIST_USER_CONVERSATIONS, (userid, _NO_LIMIT if limit is None else limit, offset)).fetchall()
+        
+        conversations = [dict(row) for row in rows]
+        for conv in conversations:
+            conv['is_pinned'] = bool(conv['is_pinned'])
+        return conversations
+    
+    def get_last_conversation(self, userid: str) -> Optional[ConversationMetadata]:
+        """Get the most recently used conversation of a user in one index-only read."""
+        with self.get_read_connection() as conn:
+            row = conn.execute(_SQL_GET_LAST_CONVERSATION, (userid,)).fetchone()
+            
+            return _conversation_from_row(row) if row else None
     
     def get_last_conversation_id(self, userid: str) -> Optional[str]:
         """Get the last conversation ID for a user."""
-        with self.get_connection() as conn:
-            row = conn.execute("""
-                SELECT id 
-                FROM conversations 
-                WHERE userid = ? 
-                ORDER BY last_used_at DESC 
-                LIMIT 1
-            """, (userid,)).fetchone()
+        with self.get_read_connection() as conn:
+            row = conn.execute(_SQL_GET_LAST_CONVERSATION_ID, (userid,)).fetchone()
             
             return row['id'] if row else None
     
     def pin_conversation(self, conversation_id: str, userid: str, is_pinned: bool = True) -> bool:
         """Pin or unpin a conversation."""
         with self.get_connection() as conn:
-            cursor = conn.execute("""
-                UPDATE conversations 
-                SET is_pinned = ? 
-                WHERE id = ? AND userid = ?
-            """, (is_pinned, conversation_id, userid))
+            cursor = conn.execute(_SQL_PIN_CONVERSATION, (is_pinned, conversation_id, userid))
             conn.commit()
             
             return cursor.rowcount > 0
@@ -258,25 +567,15 @@ class DatabaseManager:
     def update_conversation_title(self, conversation_id: str, userid: str, new_title: str) -> bool:
         """Update the title of a conversation."""
         with self.get_connection() as conn:
-            cursor = conn.execute("""
-                UPDATE conversations 
-                SET title = ? 
-                WHERE id = ? AND userid = ?
-            """, (new_title, conversation_id, userid))
+            cursor = conn.execute(_SQL_UPDATE_CONVERSATION_TITLE, (new_title, conversation_id, userid))
             conn.commit()
             
             return cursor.rowcount > 0
     
     def update_conversation_last_used(self, conversation_id: str, userid: str) -> bool:
         """Update the last_used_at timestamp for a conversation."""
-        last_used_at = int(time.time())
-        
         with self.get_connection() as conn:
-            cursor = conn.execute("""
-                UPDATE conversations 
-                SET last_used_at = ? 
-                WHERE id = ? AND userid = ?
-            """, (last_used_at, conversation_id, userid))
+            cursor = conn.execute(_SQL_UPDATE_CONVERSATION_LAST_USED, (conversation_id, userid))
             conn.commit()
             
             return cursor.rowcount > 0
@@ -284,34 +583,20 @@ class DatabaseManager:
     def delete_conversation(self, conversation_id: str, userid: str) -> bool:
         """Delete a conversation."""
         with self.get_connection() as conn:
-            cursor = conn.execute("""
-                DELETE FROM conversations 
-                WHERE id = ? AND userid = ?
-            """, (conversation_id, userid))
+            cursor = conn.execute(_SQL_DELETE_CONVERSATION, (conversation_id, userid))
             conn.commit()
             
             return cursor.rowcount > 0
     
     def conversation_exists(self, conversation_id: str, userid: str) -> bool:
         """Check if a conversation exists for a user."""
-        with self.get_connection() as conn:
-            row = conn.execute("""
-                SELECT 1 FROM conversations 
-                WHERE id = ? AND userid = ?
-            """, (conversation_id, userid)).fetchone()
-            
-            return row is not None
+        with self.get_read_connection() as conn:
+            return bool(conn.execute(_SQL_CONVERSATION_EXISTS, (conversation_id, userid)).fetchone()[0])
 
     def create_file(self, file_id: str, userid: str, filename: str, blob_name: str, workflow_id: Optional[str] = None) -> FileMetadata:
         """Create a new file metadata entry."""
-        uploaded_at = int(time.time())
-        
         with self.get_connection() as conn:
-            conn.execute("""
-                INSERT INTO files (file_id, userid, filename, blob_name, status, uploaded_at, workflow_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (file_id, userid, filename, blob_name, "pending", uploaded_at, workflow_id))
-            conn.commit()
+            uploaded_at = conn.execute(_SQL_INSERT_FILE, (file_id, userid, filename, blob_name, "pending", workflow_id)).fetchone()[0]
         
         return FileMetadata(
             file_id=file_id,
@@ -323,76 +608,95 @@ class DatabaseManager:
             workflow_id=workflow_id
         )
     
+    def create_files_bulk(self, files: Iterable[Dict[str, Any]]) -> List[FileMetadata]:
+        """Create many file metadata entries in one transaction.
+        
+        Each item takes the same keys as create_file: file_id, userid, filename,
+        blob_name and optionally workflow_id.
+        """
+        with self.transaction() as cur:
+            uploaded_at = cur.execute(_SQL_NOW).fetchone()[0]
+            created = [
+                FileMetadata(
+                    file_id=f["file_id"],
+                    userid=f["userid"],
+                    filename=f["filename"],
+                    blob_name=f["blob_name"],
+                    status="pending",
+                    uploaded_at=uploaded_at,
+                    workflow_id=f.get("workflow_id")
+                )
+                for f in files
+            ]
+            cur.executemany(_SQL_INSERT_FILE_AT, [
+                (f.file_id, f.userid, f.filename, f.blob_name, f.status, f.uploaded_at, f.workflow_id)
+                for f in created
+            ])
+        
+        return created
+    
     def get_file(self, file_id: str) -> Optional[FileMetadata]:
         """Get file metadata by ID."""
-        with self.get_connection() as conn:
-            row = conn.execute("""
-                SELECT file_id, userid, filename, blob_name, status, uploaded_at, indexed_at, error_message, workflow_id
-                FROM files 
-                WHERE file_id = ?
-            """, (file_id,)).fetchone()
+        with self.get_read_connection() as conn:
+            row = conn.execute(_SQL_GET_FILE, (file_id,)).fetchone()
             
             if row:
-                return FileMetadata(
-                    file_id=row['file_id'],
-                    userid=row['userid'],
-                    filename=row['filename'],
-                    blob_name=row['blob_name'],
-                    status=row['status'],
-                    uploaded_at=row['uploaded_at'],
-                    indexed_at=row['indexed_at'],
-                    error_message=row['error_message'],
-                    workflow_id=row['workflow_id']
-                )
+                return _file_from_row(row)
         return None
     
-    def get_user_files(self, userid: str) -> List[FileMetadata]:
-        """Get all files for a user, ordered by uploaded_at descending."""
-        with self.get_connection() as conn:
-            rows = conn.execute("""
-                SELECT file_id, userid, filename, blob_name, status, uploaded_at, indexed_at, error_message, workflow_id
-                FROM files 
-                WHERE userid = ? 
-                ORDER BY uploaded_at DESC
-            """, (userid,)).fetchall()
+    def get_files_by_ids(self, file_ids: Iterable[str]) -> Dict[str, FileMetadata]:
+        """Get several files in one query, keyed by file ID. Unknown IDs are left out."""
+        file_ids = list(set(file_ids))
+        if not file_ids:
+            return {}
+        
+        with self.get_read_connection() as conn:
+            rows = conn.execute(_SQL_GET_FILES_BY_IDS, (json.dumps(file_ids),)).fetchall()
+        
+        return {file.file_id: file for file in map(_file_from_row, rows)}
+    
+    def get_user_files(self, userid: str, limit: Optional[int] = None, offset: int = 0) -> List[FileMetadata]:
+        """Get a user's files, ordered by uploaded_at descending.
+        
+        Pass limit/offset to fetch one page instead of every file.
+        """
+        with self.get_read_connection() as conn:
+            rows = conn.execute(_SQL_GET_USER_FILES, (userid, _NO_LIMIT if limit is None else limit, offset)).fetchall()
             
-            return [
-                FileMetadata(
-                    file_id=row['file_id'],
-                    userid=row['userid'],
-                    filename=row['filename'],
-                    blob_name=row['blob_name'],
-                    status=row['status'],
-                    uploaded_at=row['uploaded_at'],
-                    indexed_at=row['indexed_at'],
-                    error_message=row['error_message'],
-                    workflow_id=row['workflow_id']
-                )
-                for row in rows
-            ]
+            return [_file_from_row(row) for row in rows]
+    
+    def get_user_files_raw(self, userid: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """Get all files for a user as plain dicts with the FileMetadata fields."""
+        with self.get_read_connection() as conn:
+            rows = conn.execute(_SQL_GET_USER_FILES, (userid, _NO_LIMIT if limit is None else limit, offset)).fetchall()
+        
+        return [dict(row) for row in rows]
     
     def update_file_status(self, file_id: str, status: str, error_message: Optional[str] = None) -> bool:
         """Update file indexing status."""
-        indexed_at = int(time.time()) if status == "completed" else None
-        
         with self.get_connection() as conn:
-            cursor = conn.execute("""
-                UPDATE files 
-                SET status = ?, indexed_at = ?, error_message = ?
-                WHERE file_id = ?
-            """, (status, indexed_at, error_message, file_id))
+            cursor = conn.execute(_SQL_UPDATE_FILE_STATUS, (status, error_message, file_id))
             conn.commit()
             
             return cursor.rowcount > 0
     
+    def update_file_statuses_bulk(self, updates: Iterable[Tuple[str, str, Optional[str]]]) -> None:
+        """Update the status of many files in one transaction.
+        
+        Each update is a (file_id, status, error_message) tuple, as taken by
+        update_file_status.
+        """
+        params = [(status, error_message, file_id) for file_id, status, error_message in updates]
+        if not params:
+            return
+        
+        with self.transaction() as cur:
+            cur.executemany(_SQL_UPDATE_FILE_STATUS, params)
+    
     def update_file_workflow_id(self, file_id: str, workflow_id: str) -> bool:
         """Update file workflow ID."""
         with self.get_connection() as conn:
-            cursor = conn.execute("""
-                UPDATE files 
-                SET workflow_id = ?
-                WHERE file_id = ?
-            """, (workflow_id, file_id))
+            cursor = conn.execute(_SQL_UPDATE_FILE_WORKFLOW_ID, (workflow_id, file_id))
             conn.commit()
             
             return cursor.rowcount > 0
@@ -400,36 +704,22 @@ class DatabaseManager:
     def delete_file(self, file_id: str, userid: str) -> bool:
         """Delete a file metadata entry."""
         with self.get_connection() as conn:
-            cursor = conn.execute("""
-                DELETE FROM files 
-                WHERE file_id = ? AND userid = ?
-            """, (file_id, userid))
+            cursor = conn.execute(_SQL_DELETE_FILE, (file_id, userid))
             conn.commit()
             
             return cursor.rowcount > 0
     
     def file_exists(self, file_id: str) -> bool:
         """Check if a file exists."""
-        with self.get_connection() as conn:
-            row = conn.execute("""
-                SELECT 1 FROM files 
-                WHERE file_id = ?
-            """, (file_id,)).fetchone()
-            
-            return row is not None
+        with self.get_read_connection() as conn:
+            return bool(conn.execute(_SQL_FILE_EXISTS, (file_id,)).fetchone()[0])
         
     def create_attachment(self, attachment_id: str, userid: str, filename: str, blob_name: str, attachment_type: str = "unknown", metadata: Optional[Dict[str, Any]] = None) -> Attachment:
         """Create a new attachment entry."""
-        import json
-        created_at = int(time.time())
         metadata_json = json.dumps(metadata) if metadata else None
         
         with self.get_connection() as conn:
-            conn.execute("""
-                INSERT INTO attachments (id, userid, filename, blob_name, type, metadata, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (attachment_id, userid, filename, blob_name, attachment_type, metadata_json, created_at))
-            conn.commit()
+            created_at = conn.execute(_SQL_INSERT_ATTACHMENT, (attachment_id, userid, filename, blob_name, attachment_type, metadata_json)).fetchone()[0]
         
         return Attachment(
             id=attachment_id,
@@ -441,101 +731,479 @@ class DatabaseManager:
             metadata=metadata
         )
     
+    def create_attachments_bulk(self, attachments: Iterable[Dict[str, Any]]) -> List[Attachment]:
+        """Create many attachment entries in one transaction.
+        
+        Each item takes the same keys as create_attachment: attachment_id, userid,
+        filename, blob_name and optionally attachment_type and metadata.
+        """
+        with self.transaction() as cur:
+            created_at = cur.execute(_SQL_NOW).fetchone()[0]
+            created = [
+                Attachment(
+                    id=a["attachment_id"],
+                    userid=a["userid"],
+                    filename=a["filename"],
+                    blob_name=a["blob_name"],
+                    type=a.get("attachment_type", "unknown"),
+                    created_at=created_at,
+                    metadata=a.get("metadata")
+                )
+                for a in attachments
+            ]
+            cur.executemany(_SQL_INSERT_ATTACHMENT_AT, [
+                (a.id, a.userid, a.filename, a.blob_name, a.type,
+                 json.dumps(a.metadata) if a.metadata else None, a.created_at)
+                for a in created
+            ])
+        
+        return created
+    
     def get_attachment(self, attachment_id: str) -> Optional[Attachment]:
         """Get attachment by ID."""
-        import json
-        with self.get_connection() as conn:
-            row = conn.execute("""
-                SELECT id, userid, filename, blob_name, type, metadata, created_at
-                FROM attachments 
-                WHERE id = ?
-            """, (attachment_id,)).fetchone()
+        cached = _attachment_cache.get_many((attachment_id,))
+        if cached:
+            return cached[attachment_id]
+        
+        with self.get_read_connection() as conn:
+            row = conn.execute(_SQL_GET_ATTACHMENT, (attachment_id,)).fetchone()
             
             if row:
-                metadata = json.loads(row['metadata']) if row['metadata'] else None
-                return Attachment(
-                    id=row['id'],
-                    userid=row['userid'],
-                    filename=row['filename'],
-                    blob_name=row['blob_name'],
-                    type=row['type'],
-                    created_at=row['created_at'],
-                    metadata=metadata
-                )
+                attachment = _attachment_from_row(row)
+                _attachment_cache.put_many((attachment,))
+                return attachment
         return None
     
+    def get_attachments_by_ids(self, attachment_ids: Iterable[str]) -> Dict[str, Attachment]:
+        """Get several attachments in one query, keyed by ID. Unknown IDs are left out."""
+        attachment_ids = set(attachment_ids)
+        attachments = _attachment_cache.get_many(attachment_ids)
+        missing = [attachment_id for attachment_id in attachment_ids if attachment_id not in attachments]
+        if not missing:
+            return attachments
+        
+        with self.get_read_connection() as conn:
+            rows = conn.execute(_SQL_GET_ATTACHMENTS_BY_IDS, (json.dumps(missing),)).fetchall()
+        
+        fetched = [_attachment_from_row(row) for row in rows]
+        _attachment_cache.put_many(fetched)
+        attachments.update((attachment.id, attachment) for attachment in fetched)
+        return attachments
+    
     def get_user_attachments(self, userid: str) -> List[Attachment]:
         """Get all attachments for a user, ordered by created_at descending."""
-        import json
-        with self.get_connection() as conn:
-            rows = conn.execute("""
-                SELECT id, userid, filename, blob_name, type, metadata, created_at
-                FROM attachments 
-                WHERE userid = ? 
-                ORDER BY created_at DESC
-            """, (userid,)).fetchall()
+        with self.get_read_connection() as conn:
+            rows = conn.execute(_SQL_GET_USER_ATTACHMENTS, (userid,)).fetchall()
             
-            return [
-                Attachment(
-                    id=row['id'],
-                    userid=row['userid'],
-                    filename=row['filename'],
-                    blob_name=row['blob_name'],
-                    type=row['type'],
-                    created_at=row['created_at'],
-                    metadata=json.loads(row['metadata']) if row['metadata'] else None
-                )
-                for row in rows
-            ]
+            return [_attachment_from_row(row) for row in rows]
+    
+    def get_user_attachments_raw(self, userid: str) -> List[Dict[str, Any]]:
+        """Get a user's attachment listing as plain dicts, ready for JSON serialization.
+        
+        Each dict has id, filename, created_at, type, metadata and url (file://{id}).
+        """
+        with self.get_read_connection() as conn:
+            rows = conn.execute(_SQL_LIST_USER_ATTACHMENTS, (userid,)).fetchall()
+        
+        attachments = [dict(row) for row in rows]
+        for att in attachments:
+            att['metadata'] = json.loads(att['metadata']) if att['metadata'] else None
+        return attachments
     
     def update_attachment_metadata(self, attachment_id: str, metadata: Optional[Dict[str, Any]]) -> bool:
         """Update attachment metadata."""
-        import json
         metadata_json = json.dumps(metadata) if metadata else None
         
         with self.get_connection() as conn:
-            cursor = conn.execute("""
-                UPDATE attachments 
-                SET metadata = ?
-                WHERE id = ?
-            """, (metadata_json, attachment_id))
+            cursor = conn.execute(_SQL_UPDATE_ATTACHMENT_METADATA, (metadata_json, attachment_id))
             conn.commit()
+            _attachment_cache.pop(attachment_id)
             
             return cursor.rowcount > 0
     
+    def update_attachment_metadata_and_get(self, attachment_id: str, metadata: Optional[Dict[str, Any]]) -> Optional[Attachment]:
+        """Update attachment metadata and return the updated attachment, or None if it doesn't exist."""
+        metadata_json = json.dumps(metadata) if metadata else None
+        
+        with self.get_connection() as conn:
+            row = conn.execute(_SQL_UPDATE_ATTACHMENT_METADATA_RETURNING, (metadata_json, attachment_id)).fetchone()
+        
+        _attachment_cache.pop(attachment_id)
+        return _attachment_from_row(row) if row else None
+    
     def update_attachment_type(self, attachment_id: str, attachment_type: str) -> bool:
         """Update attachment type."""
         with self.get_connection() as conn:
-            cursor = conn.execute("""
-                UPDATE attachments 
-                SET type = ?
-                WHERE id = ?
-            """, (attachment_type, attachment_id))
+            cursor = conn.execute(_SQL_UPDATE_ATTACHMENT_TYPE, (attachment_type, attachment_id))
             conn.commit()
+            _attachment_cache.pop(attachment_id)
             
             return cursor.rowcount > 0
     
     def delete_attachment(self, attachment_id: str) -> bool:
         """Delete an attachment."""
         with self.get_connection() as conn:
-            cursor = conn.execute("""
-                DELETE FROM attachments 
-                WHERE id = ?
-            """, (attachment_id,))
+            cursor = conn.execute(_SQL_DELETE_ATTACHMENT, (attachment_id,))
             conn.commit()
+            _attachment_cache.pop(attachment_id)
             
             return cursor.rowcount > 0
     
     def attachment_exists(self, attachment_id: str) -> bool:
         """Check if an attachment exists."""
-        with self.get_connection() as conn:
-            row = conn.execute("""
-                SELECT 1 FROM attachments 
-                WHERE id = ?
-            """, (attachment_id,)).fetchone()
-            
-            return row is not None
+        with self.get_read_connection() as conn:
+            return bool(conn.execute(_SQL_ATTACHMENT_EXISTS, (attachment_id,)).fetchone()[0])
+
+
+class AsyncDatabaseManager:
+    """Async database manager mirroring DatabaseManager for use from async handlers.
+    
+    Backed by one aiosqlite connection opened at app startup (see connect()),
+    whose queries run on aiosqlite's worker thread instead of the event loop.
+    The schema is created by the sync DatabaseManager, see get_db().
+    """
+    
+    def __init__(self, db_path: str = "mock.db"):
+        self.db_path = db_path
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+    
+    async def connect(self):
+        """Open the connection and apply the shared pragmas."""
+        # Keeps transactions from interleaving with other writes on the shared connection
+        self._write_lock = asyncio.Lock()
+        self._conn = await aiosqlite.connect(
+            self.db_path,
+            isolation_level=None,
+            cached_statements=256,
+        )
+        self._conn.row_factory = sqlite3.Row  # Enable column access by name
+        for pragma in SQLITE_PRAGMAS:
+            await self._conn.execute(pragma)
+    
+    async def close(self):
+        """Close the connection."""
+        if self._conn is not None:
+            await self._conn.execute("PRAGMA optimize")
+            await self._conn.close()
+            self._conn = None
+    
+    async def _fetchone(self, sql: str, params: tuple) -> Optional[sqlite3.Row]:
+        async with self._conn.execute(sql, params) as cursor:
+            return await cursor.fetchone()
+    
+    async def _fetchall(self, sql: str, params: tuple) -> List[sqlite3.Row]:
+        async with self._conn.execute(sql, params) as cursor:
+            return await cursor.fetchall()
+    
+    async def _write(self, sql: str, params: tuple) -> int:
+        """Run a single write statement and return the number of affected rows."""
+        async with self._write_lock:
+            async with self._conn.execute(sql, params) as cursor:
+                return cursor.rowcount
+    
+    async def _write_returning(self, sql: str, params: tuple) -> sqlite3.Row:
+        """Run a single write statement with a RETURNING clause and return its row."""
+        async with self._write_lock:
+            async with self._conn.execute(sql, params) as cursor:
+                return await cursor.fetchone()
+    
+    @asynccontextmanager
+    async def transaction(self):
+        """Run several writes in a single BEGIN IMMEDIATE/COMMIT."""
+        async with self._write_lock:
+            await self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                await self._conn.execute("ROLLBACK")
+                raise
+            await self._conn.execute("COMMIT")
+    
+    async def create_conversation(self, conversation_id: str, userid: str, title: str = "New Conversation") -> ConversationMetadata:
+        """Create a new conversation metadata entry."""
+        row = await self._write_returning(_SQL_INSERT_CONVERSATION, (conversation_id, userid, title, False))
+        
+        return ConversationMetadata(
+            id=conversation_id,
+            userid=userid,
+            title=title,
+            is_pinned=False,
+            last_used_at=row[0]
+        )
+    
+    async def get_conversation(self, conversation_id: str, userid: str) -> Optional[ConversationMetadata]:
+        """Get conversation metadata by ID and userid."""
+        row = await self._fetchone(_SQL_GET_CONVERSATION, (conversation_id, userid))
+        return _conversation_from_row(row) if row else None
+    
+    async def get_user_conversations(self, userid: str, limit: Optional[int] = None, offset: int = 0) -> List[ConversationMetadata]:
+        """Get a user's conversations, ordered by last_used_at descending.
+        
+        Pass limit/offset to fetch one page instead of the whole history.
+        """
+        rows = await self._fetchall(_SQL_GET_USER_CONVERSATIONS, (userid, _NO_LIMIT if limit is None else limit, offset))
+        return [_conversation_from_row(row) for row in rows]
+    
+    async def get_user_conversations_raw(self, userid: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """Get a user's conversation listing as plain dicts, ready for JSON serialization."""
+        rows = await self._fetchall(_SQL_LIST_USER_CONVERSATIONS, (userid, _NO_LIMIT if limit is None else limit, offset))
+        conversations = [dict(row) for row in rows]
+        for conv in conversations:
+            conv['is_pinned'] = bool(conv['is_pinned'])
+        return conversations
+    
+    async def get_last_conversation(self, userid: str) -> Optional[ConversationMetadata]:
+        """Get the most recently used conversation of a user in one index-only read."""
+        row = await self._fetchone(_SQL_GET_LAST_CONVERSATION, (userid,))
+        return _conversation_from_row(row) if row else None
+    
+    async def get_last_conversation_id(self, userid: str) -> Optional[str]:
+        """Get the last conversation ID for a user."""
+        row = await self._fetchone(_SQL_GET_LAST_CONVERSATION_ID, (userid,))
+        return row['id'] if row else None
+    
+    async def pin_conversation(self, conversation_id: str, userid: str, is_pinned: bool = True) -> bool:
+        """Pin or unpin a conversation."""
+        return await self._write(_SQL_PIN_CONVERSATION, (is_pinned, conversation_id, userid)) > 0
+    
+    async def update_conversation_title(self, conversation_id: str, userid: str, new_title: str) -> bool:
+        """Update the title of a conversation."""
+        return await self._write(_SQL_UPDATE_CONVERSATION_TITLE, (new_title, conversation_id, userid)) > 0
+    
+    async def update_conversation_last_used(self, conversation_id: str, userid: str) -> bool:
+        """Update the last_used_at timestamp for a conversation."""
+        return await self._write(_SQL_UPDATE_CONVERSATION_LAST_USED, (conversation_id, userid)) > 0
+    
+    async def delete_conversation(self, conversation_id: str, userid: str) -> bool:
+        """Delete a conversation."""
+        return await self._write(_SQL_DELETE_CONVERSATION, (conversation_id, userid)) > 0
+    
+    async def conversation_exists(self, conversation_id: str, userid: str) -> bool:
+        """Check if a conversation exists for a user."""
+        return bool((await self._fetchone(_SQL_CONVERSATION_EXISTS, (conversation_id, userid)))[0])
+    
+    async def create_file(self, file_id: str, userid: str, filename: str, blob_name: str, workflow_id: Optional[str] = None) -> FileMetadata:
+        """Create a new file metadata entry."""
+        row = await self._write_returning(_SQL_INSERT_FILE, (file_id, userid, filename, blob_name, "pending", workflow_id))
+        
+        return FileMetadata(
+            file_id=file_id,
+            userid=userid,
+            filename=filename,
+            blob_name=blob_name,
+            status="pending",
+            uploaded_at=row[0],
+            workflow_id=workflow_id
+        )
+    
+    async def create_files_bulk(self, files: Iterable[Dict[str, Any]]) -> List[FileMetadata]:
+        """Create many file metadata entries in one transaction."""
+        async with self.transaction() as conn:
+            async with conn.execute(_SQL_NOW) as cursor:
+                uploaded_at = (await cursor.fetchone())[0]
+            created = [
+                FileMetadata(
+                    file_id=f["file_id"],
+                    userid=f["userid"],
+                    filename=f["filename"],
+                    blob_name=f["blob_name"],
+                    status="pending",
+                    uploaded_at=uploaded_at,
+                    workflow_id=f.get("workflow_id")
+                )
+                for f in files
+            ]
+            await conn.executemany(_SQL_INSERT_FILE_AT, [
+                (f.file_id, f.userid, f.filename, f.blob_name, f.status, f.uploaded_at, f.workflow_id)
+                for f in created
+            ])
+        
+        return created
+    
+    async def get_file(self, file_id: str) -> Optional[FileMetadata]:
+        """Get file metadata by ID."""
+        row = await self._fetchone(_SQL_GET_FILE, (file_id,))
+        return _file_from_row(row) if row else None
+    
+    async def get_files_by_ids(self, file_ids: Iterable[str]) -> Dict[str, FileMetadata]:
+        """Get several files in one query, keyed by file ID. Unknown IDs are left out."""
+        file_ids = list(set(file_ids))
+        if not file_ids:
+            return {}
+        
+        rows = await self._fetchall(_SQL_GET_FILES_BY_IDS, (json.dumps(file_ids),))
+        return {file.file_id: file for file in map(_file_from_row, rows)}
+    
+    async def get_user_files(self, userid: str, limit: Optional[int] = None, offset: int = 0) -> List[FileMetadata]:
+        """Get a user's files, ordered by uploaded_at descending.
+        
+        Pass limit/offset to fetch one page instead of every file.
+        """
+        rows = await self._fetchall(_SQL_GET_USER_FILES, (userid, _NO_LIMIT if limit is None else limit, offset))
+        return [_file_from_row(row) for row in rows]
+    
+    async def get_user_files_raw(self, userid: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """Get all files for a user as plain dicts with the FileMetadata fields."""
+        rows = await self._fetchall(_SQL_GET_USER_FILES, (userid, _NO_LIMIT if limit is None else limit, offset))
+        return [dict(row) for row in rows]
+    
+    async def update_file_status(self, file_id: str, status: str, error_message: Optional[str] = None) -> bool:
+        """Update file indexing status."""
+        return await self._write(_SQL_UPDATE_FILE_STATUS, (status, error_message, file_id)) > 0
+    
+    async def update_file_statuses_bulk(self, updates: Iterable[Tuple[str, str, Optional[str]]]) -> None:
+        """Update the status of many files in one transaction."""
+        params = [(status, error_message, file_id) for file_id, status, error_message in updates]
+        if not params:
+            return
+        
+        async with self.transaction() as conn:
+            await conn.executemany(_SQL_UPDATE_FILE_STATUS, params)
+    
+    async def update_file_workflow_id(self, file_id: str, workflow_id: str) -> bool:
+        """Update file workflow ID."""
+        return await self._write(_SQL_UPDATE_FILE_WORKFLOW_ID, (workflow_id, file_id)) > 0
+    
+    async def delete_file(self, file_id: str, userid: str) -> bool:
+        """Delete a file metadata entry."""
+        return await self._write(_SQL_DELETE_FILE, (file_id, userid)) > 0
+    
+    async def file_exists(self, file_id: str) -> bool:
+        """Check if a file exists."""
+        return bool((await self._fetchone(_SQL_FILE_EXISTS, (file_id,)))[0])
+    
+    async def create_attachment(self, attachment_id: str, userid: str, filename: str, blob_name: str, attachment_type: str = "unknown", metadata: Optional[Dict[str, Any]] = None) -> Attachment:
+        """Create a new attachment entry."""
+        metadata_json = json.dumps(metadata) if metadata else None
+        row = await self._write_returning(_SQL_INSERT_ATTACHMENT, (attachment_id, userid, filename, blob_name, attachment_type, metadata_json))
+        
+        return Attachment(
+            id=attachment_id,
+            userid=userid,
+            filename=filename,
+            blob_name=blob_name,
+            type=attachment_type,
+            created_at=row[0],
+            metadata=metadata
+        )
+    
+    async def create_attachments_bulk(self, attachments: Iterable[Dict[str, Any]]) -> List[Attachment]:
+        """Create many attachment entries in one transaction."""
+        async with self.transaction() as conn:
+            async with conn.execute(_SQL_NOW) as cursor:
+                created_at = (await cursor.fetchone())[0]
+            created = [
+                Attachment(
+                    id=a["attachment_id"],
+                    userid=a["userid"],
+                    filename=a["filename"],
+                    blob_name=a["blob_name"],
+                    type=a.get("attachment_type", "unknown"),
+                    created_at=created_at,
+                    metadata=a.get("metadata")
+                )
+                for a in attachments
+            ]
+            await conn.executemany(_SQL_INSERT_ATTACHMENT_AT, [
+                (a.id, a.userid, a.filename, a.blob_name, a.type,
+                 json.dumps(a.metadata) if a.metadata else None, a.created_at)
+                for a in created
+            ])
+        
+        return created
+    
+    async def get_attachment(self, attachment_id: str) -> Optional[Attachment]:
+        """Get attachment by ID."""
+        cached = _attachment_cache.get_many((attachment_id,))
+        if cached:
+            return cached[attachment_id]
+        
+        row = await self._fetchone(_SQL_GET_ATTACHMENT, (attachment_id,))
+        if row is None:
+            return None
+        attachment = _attachment_from_row(row)
+        _attachment_cache.put_many((attachment,))
+        return attachment
+    
+    async def get_attachments_by_ids(self, attachment_ids: Iterable[str]) -> Dict[str, Attachment]:
+        """Get several attachments in one query, keyed by ID. Unknown IDs are left out."""
+        attachment_ids = set(attachment_ids)
+        attachments = _attachment_cache.get_many(attachment_ids)
+        missing = [attachment_id for attachment_id in attachment_ids if attachment_id not in attachments]
+        if not missing:
+            return attachments
+        
+        rows = await self._fetchall(_SQL_GET_ATTACHMENTS_BY_IDS, (json.dumps(missing),))
+        fetched = [_attachment_from_row(row) for row in rows]
+        _attachment_cache.put_many(fetched)
+        attachments.update((attachment.id, attachment) for attachment in fetched)
+        return attachments
+    
+    async def get_user_attachments(self, userid: str) -> List[Attachment]:
+        """Get all attachments for a user, ordered by created_at descending."""
+        rows = await self._fetchall(_SQL_GET_USER_ATTACHMENTS, (userid,))
+        return [_attachment_from_row(row) for row in rows]
+    
+    async def get_user_attachments_raw(self, userid: str) -> List[Dict[str, Any]]:
+        """Get a user's attachment listing as plain dicts, ready for JSON serialization."""
+        rows = await self._fetchall(_SQL_LIST_USER_ATTACHMENTS, (userid,))
+        attachments = [dict(row) for row in rows]
+        for att in attachments:
+            att['metadata'] = json.loads(att['metadata']) if att['metadata'] else None
+        return attachments
+    
+    async def update_attachment_metadata(self, attachment_id: str, metadata: Optional[Dict[str, Any]]) -> bool:
+        """Update attachment metadata."""
+        metadata_json = json.dumps(metadata) if metadata else None
+        updated = await self._write(_SQL_UPDATE_ATTACHMENT_METADATA, (metadata_json, attachment_id)) > 0
+        _attachment_cache.pop(attachment_id)
+        return updated
+    
+    async def update_attachment_metadata_and_get(self, attachment_id: str, metadata: Optional[Dict[str, Any]]) -> Optional[Attachment]:
+        """Update attachment metadata and return the updated attachment, or None if it doesn't exist."""
+        metadata_json = json.dumps(metadata) if metadata else None
+        row = await self._write_returning(_SQL_UPDATE_ATTACHMENT_METADATA_RETURNING, (metadata_json, attachment_id))
+        _attachment_cache.pop(attachment_id)
+        return _attachment_from_row(row) if row else None
+    
+    async def update_attachment_type(self, attachment_id: str, attachment_type: str) -> bool:
+        """Update attachment type."""
+        updated = await self._write(_SQL_UPDATE_ATTACHMENT_TYPE, (attachment_type, attachment_id)) > 0
+        _attachment_cache.pop(attachment_id)
+        return updated
+    
+    async def delete_attachment(self, attachment_id: str) -> bool:
+        """Delete an attachment."""
+        deleted = await self._write(_SQL_DELETE_ATTACHMENT, (attachment_id,)) > 0
+        _attachment_cache.pop(attachment_id)
+        return deleted
+    
+    async def attachment_exists(self, attachment_id: str) -> bool:
+        """Check if an attachment exists."""
+        return bool((await self._fetchone(_SQL_ATTACHMENT_EXISTS, (attachment_id,)))[0])
+
+
+# Global database manager instances. The sync one is created on first use, so
+# importing this module does no SQLite I/O; the async one is connected in the
+# app lifespan.
+_db_manager: Optional[DatabaseManager] = None
+_db_manager_lock = threading.Lock()
+async_db_manager = AsyncDatabaseManager()
+
+
+def get_db() -> DatabaseManager:
+    """Get the global DatabaseManager, creating it (and the schema) on first use."""
+    global _db_manager
+    if _db_manager is None:
+        with _db_manager_lock:
+            if _db_manager is None:
+                _db_manager = DatabaseManager()
+    return _db_manager
 
 
-# Global database manager instance
-db_manager = DatabaseManager()
\ No newline at end of file
+def __getattr__(name: str):
+    # Keeps `from lib.database import db_manager` working as a lazy alias of get_db()
+    if name == "db_manager":
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
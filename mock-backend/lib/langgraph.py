@@ -1,32 +1,62 @@
 """LangGraph utility functions for message processing."""
+import logging
 import re
-from typing import List
+from typing import Dict, Iterable, List, Optional
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
-from lib.database import db_manager
-from lib.blob import get_file_temporary_link
+from lib.database import get_db
+from lib.blob import get_file_temporary_links
 
+logger = logging.getLogger(__name__)
 
-def change_file_to_url(messages: List[BaseMessage]) -> List[BaseMessage]:
+# file://{attachment_id}, with surrounding whitespace and trailing slashes ignored
+_FILE_URL_RE = re.compile(r"^file://\s*(.*?)[\s/]*$")
+
+# SAS URLs handed to the model are valid for an hour
+_SAS_EXPIRY = 3600
+
+
+def change_file_to_url(messages: Iterable[BaseMessage]) -> List[BaseMessage]:
     """
     Convert file://{id} URLs to temporary blob URLs with SAS tokens in all messages.
     
     This function inspects all messages and looks for image_url content with file:// URLs,
     then replaces them with temporary blob URLs (valid for 1 hour) before sending to AI.
+    All referenced attachments are resolved up front with one database query and
+    one SAS batch, instead of a lookup and a signing per image.
     
     Args:
-        messages: List of BaseMessage objects that may contain file:// URLs
+        messages: BaseMessage objects (any iterable, consumed once) that may contain file:// URLs
         
     Returns:
         List[BaseMessage]: Messages with file:// URLs replaced by blob URLs with SAS tokens
     """
+    messages = list(messages)
+    
+    # Most conversations are text only: messages without file:// URLs are
+    # passed through as they are, and nothing is rebuilt if there are none
+    has_file_urls = [has_file_url(message) for message in messages]
+    if not any(has_file_urls):
+        return messages
+    
+    attachment_ids = {
+        attachment_id
+        for message, has_files in zip(messages, has_file_urls)
+        if has_files
+        for item in message.content
+        if (attachment_id := get_attachment_id(item))
+    }
+    blob_urls = resolve_attachment_urls(attachment_ids)
+    
     processed_messages = []
     
-    for message in messages:
+    for message, has_files in zip(messages, has_file_urls):
+        if not has_files:
+            processed_message = message
         # Create a copy of the message to avoid modifying the original
-        if isinstance(message, HumanMessage):
-            processed_message = process_human_message(message)
+        elif isinstance(message, HumanMessage):
+            processed_message = process_human_message(message, blob_urls)
         elif isinstance(message, AIMessage):
-            processed_message = process_ai_message(message)
+            processed_message = process_ai_message(message, blob_urls)
         elif isinstance(message, SystemMessage):
             # System messages typically don't have images
             processed_message = message
@@ -39,20 +69,79 @@ def change_file_to_url(messages: List[BaseMessage]) -> List[BaseMessage]:
     return processed_messages
 
 
-def process_human_message(message: HumanMessage) -> HumanMessage:
+def get_attachment_id(item) -> Optional[str]:
+    """
+    Get the attachment ID of an image_url content item pointing at a file:// URL.
+    
+    Args:
+        item: Content item of a message
+        
+    Returns:
+        Optional[str]: The attachment ID (empty if the URL has none), or None if
+        the item is not a file:// image_url
+    """
+    if not isinstance(item, dict) or item.get('type') != 'image_url':
+        return None
+    
+    image_url_obj = item.get('image_url')
+    url = image_url_obj.get('url', '') if isinstance(image_url_obj, dict) else ''
+    match = _FILE_URL_RE.match(url)
+    return match.group(1) if match else None
+
+
+def has_file_url(message: BaseMessage) -> bool:
+    """Check whether a message has any image_url content item pointing at a file:// URL."""
+    content = message.content
+    return isinstance(content, list) and any(get_attachment_id(item) is not None for item in content)
+
+
+def resolve_attachment_urls(attachment_ids: Iterable[str]) -> Dict[str, str]:
+    """
+    Resolve attachment IDs to temporary blob URLs with SAS tokens (valid for 1 hour).
+    
+    The same attachments are referenced on every turn of a conversation. The
+    attachment rows come from the database's attachment cache, and lib.blob
+    reuses a signed URL only while it is valid for at least half of the
+    expiry, so no URL close to expiring is handed out.
+    
+    Args:
+        attachment_ids: Attachment IDs to resolve
+        
+    Returns:
+        Dict[str, str]: Blob URL for each attachment ID that exists
+    """
+    attachment_ids = set(attachment_ids)
+    if not attachment_ids:
+        return {}
+    
+    try:
+        attachments = get_db().get_attachments_by_ids(attachment_ids)
+        blob_urls = get_file_temporary_links(
+            (attachment.blob_name for attachment in attachments.values()),
+            expiry=_SAS_EXPIRY
+        )
+    except Exception as e:
+        # If any error occurs, log it and leave the unresolved file:// URLs as they are
+        logger.error("Error resolving attachment URLs: %s", e)
+        return {}
+    
+    return {
+        attachment_id: blob_urls[attachment.blob_name]
+        for attachment_id, attachment in attachments.items()
+    }
+
+
+def process_human_message(message: HumanMessage, blob_urls: Optional[Dict[str, str]] = None) -> HumanMessage:
     """
     Process HumanMessage to convert file:// URLs to blob URLs.
     
     Args:
         message: HumanMessage that may contain file:// URLs
+        blob_urls: Pre-resolved blob URLs by attachment ID (resolved on demand if omitted)
         
     Returns:
         HumanMessage: Message with converted URLs
     """
-    # Check if message has content attribute
-    if not hasattr(message, 'content'):
-        return message
-    
     content = message.content
     
     # If content is a string, no images to process
@@ -62,12 +151,14 @@ def process_human_message(message: HumanMessage) -> HumanMessage:
     # If content is a list (multimodal content)
     if isinstance(content, list):
         new_content = []
+        changed = False
         
         for item in content:
             if isinstance(item, dict):
                 # Check if this is an image_url type
                 if item.get('type') == 'image_url':
-                    new_item = process_image_url_item(item)
+                    new_item = process_image_url_item(item, blob_urls)
+                    changed = changed or new_item is not item
                     new_content.append(new_item)
                 else:
                     # Keep other content types as is (text, etc.)
@@ -75,17 +166,21 @@ def process_human_message(message: HumanMessage) -> HumanMessage:
             else:
                 new_content.append(item)
         
+        # Nothing was rewritten (e.g. no attachment resolved), keep the original
+        if not changed:
+            return message
+        
         # Create new HumanMessage with updated content
         return HumanMessage(
             content=new_content,
-            additional_kwargs=message.additional_kwargs if hasattr(message, 'additional_kwargs') else {},
-            id=message.id if hasattr(message, 'id') else None
+            additional_kwargs=message.additional_kwargs,
+            id=message.id
         )
     
     return message
 
 
-def process_ai_message(message: AIMessage) -> AIMessage:
+def process_ai_message(message: AIMessage, blob_urls: Optional[Dict[str, str]] = None) -> AIMessage:
     """
     Process AIMessage to convert file:// URLs to blob URLs.
     
@@ -94,14 +189,11 @@ def process_ai_message(message: AIMessage) -> AIMessage:
     
     Args:
         message: AIMessage that may contain file:// URLs
+        blob_urls: Pre-resolved blob URLs by attachment ID (resolved on demand if omitted)
         
     Returns:
         AIMessage: Message with converted URLs
     """
-    # Check if message has content attribute
-    if not hasattr(message, 'content'):
-        return message
-    
     content = message.content
     
     # If content is a string, no images to process
@@ -111,29 +203,35 @@ def process_ai_message(message: AIMessage) -> AIMessage:
     # If content is a list (multimodal content)
     if isinstance(content, list):
         new_content = []
+        changed = False
         
         for item in content:
             if isinstance(item, dict):
                 # Check if this is an image_url type
                 if item.get('type') == 'image_url':
-                    new_item = process_image_url_item(item)
+                    new_item = process_image_url_item(item, blob_urls)
+                    changed = changed or new_item is not item
                     new_content.append(new_item)
                 else:
                     new_content.append(item)
             else:
                 new_content.append(item)
         
+        # Nothing was rewritten (e.g. no attachment resolved), keep the original
+        if not changed:
+            return message
+        
         # Create new AIMessage with updated content
         return AIMessage(
             content=new_content,
-            additional_kwargs=message.additional_kwargs if hasattr(message, 'additional_kwargs') else {},
-            id=message.id if hasattr(message, 'id') else None
+            additional_kwargs=message.additional_kwargs,
+            id=message.id
         )
     
     return message
 
 
-def process_image_url_item(item: dict) -> dict:
+def process_image_url_item(item: dict, blob_urls: Optional[Dict[str, str]] = None) -> dict:
     """
     Process a single image_url content item to convert file:// URL to blob URL.
     
@@ -155,55 +253,41 @@ def process_image_url_item(item: dict) -> dict:
     
     Args:
         item: Dictionary containing image_url content
+        blob_urls: Pre-resolved blob URLs by attachment ID (resolved on demand if omitted)
         
     Returns:
         dict: Updated item with blob URL
     """
-    try:
-        # Get the URL from the nested structure
-        image_url_obj = item.get('image_url', {})
-        url = image_url_obj.get('url', '')
-        
-        # Check if it's a file:// URL
-        if url.startswith('file://'):
-            # Extract attachment ID and sanitize it
-            attachment_id = url.replace('file://', '')
-            # Remove trailing slashes and whitespace
-            attachment_id = attachment_id.rstrip('/').strip()
-            
-            if not attachment_id:
-                # Empty ID after sanitization
-                print(f"Warning: Empty attachment ID after sanitization from URL: {url}")
-                return item
-
-            # Get attachment from database
-            attachment = db_manager.get_attachment(attachment_id)
-            
-            if attachment:
-                # Get temporary blob URL with SAS token (valid for 1 hour)
-                blob_url = get_file_temporary_link(attachment.blob_name, expiry=3600)
-                
-                # Return updated item with blob URL
-                return {
-                    'type': 'image_url',
-                    'image_url': {
-                        'url': blob_url,
-                        # Preserve any additional fields
-                        **{k: v for k, v in image_url_obj.items() if k != 'url'}
-                    }
-                }
-            else:
-                # Attachment not found, log warning and return original
-                print(f"Warning: Attachment not found for ID: {attachment_id}")
-                return item
-        else:
-            # Not a file:// URL, return as is (might be http/https URL)
-            return item
-            
-    except Exception as e:
-        # If any error occurs, log it and return original item
-        print(f"Error processing image_url item: {e}")
+    attachment_id = get_attachment_id(item)
+    
+    if attachment_id is None:
+        # Not a file:// URL, return as is (might be http/https URL)
+        return item
+    
+    if not attachment_id:
+        # Empty ID after sanitization
+        logger.warning("Empty attachment ID after sanitization from URL: %s", item['image_url']['url'])
         return item
+    
+    if blob_urls is None:
+        blob_urls = resolve_attachment_urls([attachment_id])
+    
+    blob_url = blob_urls.get(attachment_id)
+    if blob_url is None:
+        # Attachment not found, log warning and return original
+        logger.warning("Attachment not found for ID: %s", attachment_id)
+        return item
+    
+    # Return updated item with blob URL
+    image_url_obj = item['image_url']
+    return {
+        'type': 'image_url',
+        'image_url': {
+            'url': blob_url,
+            # Preserve any additional fields
+            **{k: v for k, v in image_url_obj.items() if k != 'url'}
+        }
+    }
 
 
 def extract_file_ids_from_messages(messages: List[BaseMessage]) -> List[str]:
@@ -221,17 +305,12 @@ def extract_file_ids_from_messages(messages: List[BaseMessage]) -> List[str]:
     file_ids = []
     
     for message in messages:
-        if not hasattr(message, 'content'):
-            continue
-            
         content = message.content
         
         if isinstance(content, list):
             for item in content:
-                if isinstance(item, dict) and item.get('type') == 'image_url':
-                    url = item.get('image_url', {}).get('url', '')
-                    if url.startswith('file://'):
-                        file_id = url.replace('file://', '')
-                        file_ids.append(file_id)
+                file_id = get_attachment_id(item)
+                if file_id is not None:
+                    file_ids.append(file_id)
     
     return file_ids
@@ -1,31 +1,88 @@
 import os
-from azure.search.documents import SearchClient
+import time
+import asyncio
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 from azure.core.credentials import AzureKeyCredential
-from azure.search.documents.indexes import SearchIndexClient
-from azure.search.documents.indexes.models import (
-    SearchField,
-    SearchFieldDataType,
-    VectorSearch,
-    HnswAlgorithmConfiguration,
-    VectorSearchProfile,
-    AzureOpenAIVectorizer,
-    AzureOpenAIVectorizerParameters,
-    SearchIndex,
-    SemanticSearch,
-    SemanticConfiguration,
-    SemanticPrioritizedFields,
-    SemanticField,
-    SimpleField,
-    SearchableField
-)
+
+if TYPE_CHECKING:
+    from azure.search.documents import SearchClient
+    from azure.search.documents.models import IndexingResult
+    from azure.search.documents.aio import SearchClient as AsyncSearchClient
 
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# HNSW settings by expected corpus size as (max vectors, m, efConstruction, efSearch).
+# Azure AI Search allows m in 4-10 and efConstruction/efSearch in 100-1000; its
+# defaults (4/400/500) are sized for large corpora, so smaller indexes trade
+# some of that for faster builds and queries.
+_HNSW_TIERS = [
+    (100_000, 4, 100, 100),
+    (1_000_000, 8, 200, 200),
+]
+_HNSW_LARGE = (10, 400, 500)
+
+
+def configure_hnsw_params(vector_count: int) -> Dict[str, int]:
+    """
+    Pick HNSW parameters for the expected number of vectors in the index.
+    
+    Args:
+        vector_count: Expected number of vectors
+        
+    Returns:
+        Dict[str, int]: m, ef_construction and ef_search for HnswParameters
+    """
+    m, ef_construction, ef_search = _HNSW_LARGE
+    for max_vectors, *params in _HNSW_TIERS:
+        if vector_count < max_vectors:
+            m, ef_construction, ef_search = params
+            break
+    return {"m": m, "ef_construction": ef_construction, "ef_search": ef_search}
+
+
+def get_hnsw_params() -> Dict[str, int]:
+    """
+    HNSW parameters for the corpus size set in AZURE_SEARCH_EXPECTED_VECTORS.
+    
+    Returns:
+        Dict[str, int]: Parameters for HnswParameters, empty to keep the
+        service defaults when the expected size is not set
+    """
+    expected_vectors = os.getenv("AZURE_SEARCH_EXPECTED_VECTORS")
+    if not expected_vectors:
+        return {}
+    return configure_hnsw_params(int(expected_vectors))
+
+
 def ensure_search_index() -> bool:
     """Ensure the Azure AI Search index exists with proper schema."""
+    # The index management SDK is only needed here, import it on first use
+    from azure.search.documents.indexes import SearchIndexClient
+    from azure.search.documents.indexes.models import (
+        SearchField,
+        SearchFieldDataType,
+        VectorSearch,
+        HnswAlgorithmConfiguration,
+        HnswParameters,
+        VectorSearchProfile,
+        AzureOpenAIVectorizer,
+        AzureOpenAIVectorizerParameters,
+        SearchIndex,
+        SemanticSearch,
+        SemanticConfiguration,
+        SemanticPrioritizedFields,
+        SemanticField,
+        SimpleField,
+        SearchableField
+    )
+    
     try:
         search_index_client = SearchIndexClient(
             endpoint=os.getenv("AZURE_SEARCH_ENDPOINT"),
@@ -36,10 +93,10 @@ def ensure_search_index() -> bool:
         # Check if index exists
         try:
             search_index_client.get_index(index_name)
-            logger.info(f"Search index '{index_name}' already exists")
+            logger.info("Search index '%s' already exists", index_name)
             return True
         except Exception:
-            logger.info(f"Creating search index '{index_name}'")
+            logger.info("Creating search index '%s'", index_name)
         
         # Define the search index schema
         fields = [
@@ -61,7 +118,10 @@ def ensure_search_index() -> bool:
         # Configure vector search
         vector_search = VectorSearch(
             algorithms=[
-                HnswAlgorithmConfiguration(name="my-hnsw")
+                HnswAlgorithmConfiguration(
+                    name="my-hnsw",
+                    parameters=HnswParameters(metric="cosine", **get_hnsw_params())
+                )
             ],
             vectorizers=[  
                 AzureOpenAIVectorizer(  
@@ -103,19 +163,151 @@ def ensure_search_index() -> bool:
         )
         
         search_index_client.create_index(index)
-        logger.info(f"Successfully created search index '{index_name}'")
+        logger.info("Successfully created search index '%s'", index_name)
         return True
         
     except Exception as e:
-        logger.error(f"Failed to ensure search index: {str(e)}")
+        logger.error("Failed to ensure search index: %s", e)
         return False
 
 
-ensure_search_index()
-def get_search_client():
-    """Get Azure AI Search client."""
+# Set once the index is known to exist, so the check runs once per process
+_index_ready = False
+_index_lock = threading.Lock()
+
+# After a failed check, requests don't retry it until this monotonic time
+_INDEX_RETRY_BACKOFF = 60
+_index_retry_at = 0.0
+
+
+def _index_sentinel_path() -> str:
+    """Path of the file recording that the search index was ensured on this host."""
+    # Keyed by endpoint and index, so services sharing an index name don't share a sentinel
+    target = f"{os.getenv('AZURE_SEARCH_ENDPOINT')}|{os.getenv('AZURE_SEARCH_INDEX_NAME')}"
+    digest = hashlib.sha256(target.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f".search_index_ready_{digest}")
+
+
+def _index_check_pending() -> bool:
+    """Whether the index is not known to exist and a check may run now."""
+    return not _index_ready and time.monotonic() >= _index_retry_at
+
+
+def ensure_search_index_once() -> bool:
+    """
+    Run ensure_search_index until it succeeds once in this process.
+    
+    With AZURE_SEARCH_SKIP_CHECK=1, a sentinel file written after an earlier
+    success lets restarted processes skip the get_index round-trip. After a
+    failure the check is not retried for _INDEX_RETRY_BACKOFF seconds, so
+    requests don't each hit the service while it is unavailable.
+    """
+    global _index_ready, _index_retry_at
+    if _index_check_pending():
+        with _index_lock:
+            if _index_check_pending():
+                sentinel = _index_sentinel_path()
+                if os.getenv("AZURE_SEARCH_SKIP_CHECK") == "1" and os.path.exists(sentinel):
+                    _index_ready = True
+                else:
+                    _index_ready = ensure_search_index()
+                    if _index_ready:
+                        try:
+                            open(sentinel, "a").close()
+                        except OSError as e:
+                            logger.warning("Failed to write search index sentinel %s: %s", sentinel, e)
+                    else:
+                        _index_retry_at = time.monotonic() + _INDEX_RETRY_BACKOFF
+    return _index_ready
+
+
+# An indexing request is limited to 1000 documents and 16 MB. A chunk with its
+# 1536-dimension vector serializes to roughly 35 KB, so batches are sized by
+# the payload limit rather than the document count.
+UPLOAD_BATCH_SIZE = 400
+UPLOAD_CONCURRENCY = 8
+
+
+def upload_documents_batched(
+    search_client: "SearchClient",
+    documents: List[Dict[str, Any]],
+    batch_size: int = UPLOAD_BATCH_SIZE,
+    concurrency: int = UPLOAD_CONCURRENCY,
+) -> List["IndexingResult"]:
+    """
+    Upload documents in batches, keeping several requests in flight.
+    
+    Args:
+        search_client: Search client for the target index (thread-safe)
+        documents: Documents to upload
+        batch_size: Documents per request
+        concurrency: Maximum number of concurrent requests
+        
+    Returns:
+        List[IndexingResult]: Result for each document, in input order
+    """
+    batches = [documents[i:i + batch_size] for i in range(0, len(documents), batch_size)]
+    if len(batches) <= 1:
+        return [result for batch in batches for result in search_client.upload_documents(documents=batch)]
+    
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as executor:
+        return [
+            result
+            for results in executor.map(lambda batch: search_client.upload_documents(documents=batch), batches)
+            for result in results
+        ]
+
+
+@lru_cache(maxsize=1)
+def _create_search_client() -> "SearchClient":
+    """Create the shared SearchClient; SearchClient is safe to share across threads."""
+    from azure.search.documents import SearchClient
+    
     return SearchClient(
         endpoint=os.getenv("AZURE_SEARCH_ENDPOINT"),
         index_name=os.getenv("AZURE_SEARCH_INDEX_NAME"),
         credential=AzureKeyCredential(os.getenv("AZURE_SEARCH_API_KEY"))
-    )
\ No newline at end of file
+    )
+
+
+def get_search_client() -> "SearchClient":
+    """Get Azure AI Search client.
+    
+    Every request reuses one cached client and its HTTP connection pool. The
+    index is ensured on first use rather than when this module is imported.
+    """
+    ensure_search_index_once()
+    return _create_search_client()
+
+
+# The async client pools connections in an aiohttp session tied to the
+# running event loop, so it is created lazily inside the server's loop
+_async_search_client: Optional["AsyncSearchClient"] = None
+
+
+async def get_async_search_client() -> "AsyncSearchClient":
+    """Get the shared async Azure AI Search client for use in async routes.
+    
+    Searches are awaited on the event loop instead of blocking it or taking
+    a threadpool worker.
+    """
+    global _async_search_client
+    if _index_check_pending():
+        await asyncio.to_thread(ensure_search_index_once)
+    if _async_search_client is None:
+        from azure.search.documents.aio import SearchClient as AsyncSearchClient
+        
+        _async_search_client = AsyncSearchClient(
+            endpoint=os.getenv("AZURE_SEARCH_ENDPOINT"),
+            index_name=os.getenv("AZURE_SEARCH_INDEX_NAME"),
+            credential=AzureKeyCredential(os.getenv("AZURE_SEARCH_API_KEY"))
+        )
+    return _async_search_client
+
+
+async def close_async_search_client():
+    """Close the shared async search client and its connection pool."""
+    global _async_search_client
+    if _async_search_client is not None:
+        await _async_search_client.close()
+        _async_search_client = None
@@ -0,0 +1,89 @@
+"""Semantic (embedding-based) response cache for repeated questions."""
+import logging
+import math
+import os
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Deque, Dict, Optional, Tuple
+
+from openai import AzureOpenAI
+
+logger = logging.getLogger(__name__)
+
+# Setting a cosine similarity threshold (e.g. 0.92) turns the cache on
+SEMANTIC_CACHE_THRESHOLD = os.getenv("SEMANTIC_CACHE_THRESHOLD")
+# Answers kept per user; the oldest are evicted first
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 256))
+
+
+@lru_cache(maxsize=1)
+def get_embedding_client() -> AzureOpenAI:
+    """Get the Azure OpenAI client used for question embeddings."""
+    return AzureOpenAI(
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+    )
+
+
+@lru_cache(maxsize=128)
+def embed_question(text: str) -> Tuple[float, ...]:
+    """
+    Embed a question and normalize it to unit length.
+
+    Memoized so the lookup and the store for the same turn share one
+    embedding call.
+    """
+    response = get_embedding_client().embeddings.create(
+        input=text,
+        model=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME", "text-embedding-ada-002")
+    )
+    vector = response.data[0].embedding
+    norm = math.hypot(*vector)
+    return tuple(v / norm for v in vector) if norm else tuple(vector)
+
+
+class SemanticCache:
+    """In-memory, per-user store of (question embedding, answer) pairs."""
+
+    def __init__(self, threshold: float, max_entries: int = 256):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries: Dict[str, Deque[Tuple[Tuple[float, ...], str]]] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, userid: str, question: str) -> Optional[str]:
+        """Return the cached answer closest to the question if it clears the threshold."""
+        embedding = embed_question(question)
+        with self._lock:
+            entries = list(self._entries.get(userid, ()))
+
+        best_score, best_answer = -1.0, None
+        for cached_embedding, answer in entries:
+            # Both vectors are unit length, so the dot product is the cosine similarity
+            score = math.sumprod(cached_embedding, embedding)
+            if score > best_score:
+                best_score, best_answer = score, answer
+
+        if best_score >= self.threshold:
+            logger.debug("Semantic cache hit for user %s (score=%.3f)", userid, best_score)
+            return best_answer
+        return None
+
+    def store(self, userid: str, question: str, answer: str) -> None:
+        """Cache the answer to a question for the user."""
+        embedding = embed_question(question)
+        with self._lock:
+            entries = self._entries.get(userid)
+            if entries is None:
+                entries = self._entries[userid] = deque(maxlen=self.max_entries)
+            entries.append((embedding, answer))
+
+
+# Global cache instance, None when the cache is not configured
+semantic_cache = (
+    SemanticCache(float(SEMANTIC_CACHE_THRESHOLD), SEMANTIC_CACHE_MAX_ENTRIES)
+    if SEMANTIC_CACHE_THRESHOLD
+    else None
+)
@@ -1,13 +1,16 @@
 import os
 from dotenv import load_dotenv
-from langchain_azure_ai.callbacks.tracers import AzureAIOpenTelemetryTracer
-from opentelemetry.instrumentation.langchain import LangchainInstrumentor
 
 load_dotenv()
 
 def get_microsoft_tracer() -> list:
     if not os.environ.get("APPLICATION_INSIGHTS_CONNECTION_STRING"):
         return []
+    
+    # Only load the tracing SDKs when tracing is configured
+    from langchain_azure_ai.callbacks.tracers import AzureAIOpenTelemetryTracer
+    from opentelemetry.instrumentation.langchain import LangchainInstrumentor
+    
     instrumentor = LangchainInstrumentor()
     if not instrumentor.is_instrumented_by_opentelemetry:
         instrumentor.instrument()
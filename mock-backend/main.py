@@ -1,5 +1,6 @@
 """Main FastAPI server with LangGraph integration."""
 import os
+import logging
 # import sys
 # sys.dont_write_bytecode = True
 
@@ -7,20 +8,49 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
+# Configure logging once for the whole process
+logging.basicConfig(level=logging.INFO)
+
 from typing import Annotated
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, Depends
 
 # Utils and modules
 from lib.auth import verify_credentials
+from agent.graph import checkpointer_lifespan
+from lib.database import get_db, async_db_manager
+from lib.search import ensure_search_index_once, close_async_search_client
 
 # Run orchestration
 from orchestration import get_orchestrator
 orchestrator = get_orchestrator()
 orchestrator.start()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open long-lived async resources for the lifetime of the server."""
+    # Make sure the search index exists in the background instead of blocking startup
+    search_index_task = asyncio.create_task(asyncio.to_thread(ensure_search_index_once))
+    # The async manager relies on the schema the sync DatabaseManager creates
+    await asyncio.to_thread(get_db)
+    await async_db_manager.connect()
+    try:
+        async with checkpointer_lifespan():
+            yield
+    finally:
+        await async_db_manager.close()
+        if not search_index_task.done():
+            search_index_task.cancel()
+        await close_async_search_client()
+    
+    # The orchestrator may still use the connections, so only optimize here
+    get_db().optimize()
+
+
 # Initialize FastAPI app
-app = FastAPI(title="LangGraph Azure Inference API", version="1.0.0")
+app = FastAPI(title="LangGraph Azure Inference API", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware to allow all origins
 app.add_middleware(
@@ -2,11 +2,10 @@
 Migration script to remove conversation_id from attachments table.
 
 This script:
-1. Creates a backup of the attachments table
-2. Drops the old attachments table
-3. Creates a new attachments table without conversation_id
-4. Migrates data from backup (if needed)
-5. Recreates indexes
+1. Renames the old attachments table to a backup table
+2. Creates a new attachments table without conversation_id
+3. Migrates data from backup (if needed)
+4. Recreates indexes
 
 Run this script once to update your database schema.
 """
@@ -29,10 +28,19 @@ def migrate_attachments_table(db_path: str = "mock.db"):
         shutil.copy2(db_path, backup_path)
         print("Backup created successfully")
     
-    # Connect to database
-    conn = sqlite3.connect(db_path)
+    # Connect to database. Transactions are managed explicitly below so the
+    # whole migration (DDL included) runs as one BEGIN IMMEDIATE/COMMIT.
+    conn = sqlite3.connect(db_path, isolation_level=None)
     cursor = conn.cursor()
     
+    # Session settings for the bulk copy. Durability is traded for speed
+    # because a backup of the database file was taken above.
+    cursor.executescript("""
+        PRAGMA synchronous=OFF;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-200000;
+    """)
+    
     try:
         # Check if attachments table exists
         cursor.execute("""
@@ -54,22 +62,24 @@ def migrate_attachments_table(db_path: str = "mock.db"):
             return
         
         print("Starting migration...")
+        cursor.execute("BEGIN IMMEDIATE")
         
-        # Create temporary backup table
+        # Drop old indexes. Renaming the table below moves its indexes along
+        # with it, so any left in place would clash with the names recreated
+        # on the new table (e.g. the one init_db adds to existing tables)
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS attachments_backup AS 
-            SELECT * FROM attachments
+            SELECT name FROM sqlite_master
+            WHERE type='index' AND tbl_name='attachments' AND sql IS NOT NULL
         """)
-        print("Created backup table")
-        
-        # Drop old indexes
-        cursor.execute("DROP INDEX IF EXISTS idx_attachments_conversation_id")
-        cursor.execute("DROP INDEX IF EXISTS idx_attachments_created_at")
+        for (index_name,) in cursor.fetchall():
+            cursor.execute(f'DROP INDEX "{index_name}"')
         print("Dropped old indexes")
         
-        # Drop old table
-        cursor.execute("DROP TABLE attachments")
-        print("Dropped old attachments table")
+        # Keep the old rows as a temporary backup table. Renaming only
+        # rewrites the schema entry, unlike copying every row into a new table.
+        cursor.execute("DROP TABLE IF EXISTS attachments_backup")
+        cursor.execute("ALTER TABLE attachments RENAME TO attachments_backup")
+        print("Renamed old attachments table to backup table")
         
         # Create new table without conversation_id
         cursor.execute("""
@@ -106,13 +116,8 @@ def migrate_attachments_table(db_path: str = "mock.db"):
         
         # Create new indexes
         cursor.execute("""
-            CREATE INDEX idx_attachments_userid 
-            ON attachments(userid)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX idx_attachments_created_at 
-            ON attachments(created_at DESC)
+            CREATE INDEX idx_attachments_userid_created_at 
+            ON attachments(userid, created_at DESC)
         """)
         print("Created new indexes")
         
@@ -120,10 +125,17 @@ def migrate_attachments_table(db_path: str = "mock.db"):
         cursor.execute("DROP TABLE attachments_backup")
         print("Dropped backup table")
         
+        # Reset the schema version so the app re-runs its migrations on next
+        # start and adds the type/metadata columns to the new table
+        cursor.execute("PRAGMA user_version = 0")
+        
         # Commit changes
-        conn.commit()
+        cursor.execute("COMMIT")
         print("Migration completed successfully!")
         
+        # Refresh planner statistics for the rebuilt table and index
+        cursor.execute("ANALYZE attachments")
+        
         # Show new schema
         cursor.execute("PRAGMA table_info(attachments)")
         new_columns = [col[1] for col in cursor.fetchall()]
@@ -131,7 +143,8 @@ def migrate_attachments_table(db_path: str = "mock.db"):
         
     except Exception as e:
         print(f"Error during migration: {e}")
-        conn.rollback()
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
         raise
     
     finally:
@@ -4,6 +4,7 @@ A workflow to index and chunk a file using Azure services.
 
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 from py_orchestrate import activity, workflow
 from azure.storage.blob import BlobServiceClient
@@ -18,6 +19,7 @@ from azure.search.documents.indexes.models import (
     SearchFieldDataType,
     VectorSearch,
     HnswAlgorithmConfiguration,
+    HnswParameters,
     VectorSearchProfile,
     SemanticConfiguration,
     SemanticSearch,
@@ -31,12 +33,15 @@ from azure.search.documents.indexes.models import (
 from azure.ai.documentintelligence.models import AnalyzeDocumentRequest, AnalyzeResult
 from openai import AzureOpenAI
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from lib.database import db_manager
+from lib.database import get_db
+from lib.search import get_hnsw_params, upload_documents_batched
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Chunks per embeddings request. The API accepts up to 2048 inputs but also caps
+# the tokens per request, and 256 chunks of ~1000 characters stay well under it.
+_EMBEDDING_BATCH_SIZE = 256
+
 # Azure clients initialization
 def get_azure_clients():
     """Initialize Azure service clients."""
@@ -82,10 +87,10 @@ def ensure_search_index_v1() -> bool:
         # Check if index exists
         try:
             search_index_client.get_index(index_name)
-            logger.info(f"Search index '{index_name}' already exists")
+            logger.info("Search index '%s' already exists", index_name)
             return True
         except Exception:
-            logger.info(f"Creating search index '{index_name}'")
+            logger.info("Creating search index '%s'", index_name)
         
         # Define the search index schema
         fields = [
@@ -107,7 +112,10 @@ def ensure_search_index_v1() -> bool:
         # Configure vector search
         vector_search = VectorSearch(
             algorithms=[
-                HnswAlgorithmConfiguration(name="my-hnsw")
+                HnswAlgorithmConfiguration(
+                    name="my-hnsw",
+                    parameters=HnswParameters(metric="cosine", **get_hnsw_params())
+                )
             ],
             vectorizers=[  
                 AzureOpenAIVectorizer(  
@@ -149,11 +157,11 @@ def ensure_search_index_v1() -> bool:
         )
         
         search_index_client.create_index(index)
-        logger.info(f"Successfully created search index '{index_name}'")
+        logger.info("Successfully created search index '%s'", index_name)
         return True
         
     except Exception as e:
-        logger.error(f"Failed to ensure search index: {str(e)}")
+        logger.error("Failed to ensure search index: %s", e)
         return False
 
 def extract_markdown_from_result(result: AnalyzeResult) -> str:
@@ -189,7 +197,7 @@ def ocr_file_v1(file_id: str) -> str:
         blob_service, doc_intelligence, _, _, _ = get_azure_clients()
         
         # Get file metadata
-        file_metadata = db_manager.get_file(file_id)
+        file_metadata = get_db().get_file(file_id)
         if not file_metadata:
             raise ValueError(f"File {file_id} not found in database")
         
@@ -202,7 +210,7 @@ def ocr_file_v1(file_id: str) -> str:
         
         file_content = blob_client.download_blob().readall()
 
-        logger.info(f"Downloaded file {file_id} from blob storage, size: {len(file_content)} bytes")
+        logger.info("Downloaded file %s from blob storage, size: %s bytes", file_id, len(file_content))
         
         # Use Document Intelligence to extract content
         poller = doc_intelligence.begin_analyze_document(
@@ -216,11 +224,11 @@ def ocr_file_v1(file_id: str) -> str:
         # Extract markdown content
         content = result.content
         
-        logger.info(f"Successfully extracted content from file {file_id}, length: {len(content)}")
+        logger.info("Successfully extracted content from file %s, length: %s", file_id, len(content))
         return content
         
     except Exception as e:
-        logger.error(f"Failed to extract content from file {file_id}: {str(e)}")
+        logger.error("Failed to extract content from file %s: %s", file_id, e)
         raise
 
 @activity("chunk_file_v1")
@@ -234,12 +242,39 @@ def chunk_file_v1(content: str) -> List[str]:
             separators=["\n\n", "\n", ".", " ", ""],
         )
         chunks = splitter.split_text(content)
-        logger.info(f"Successfully chunked content into {len(chunks)} pieces")
+        logger.info("Successfully chunked content into %s pieces", len(chunks))
         return [chunk.strip() for chunk in chunks if chunk.strip()]
     except Exception as e:
-        logger.error(f"Failed to chunk content: {str(e)}")
+        logger.error("Failed to chunk content: %s", e)
         raise
 
+def embed_texts(openai_client: AzureOpenAI, texts: List[str], model: str) -> List[List[float]]:
+    """
+    Embed texts in batches, sending up to OPENAI_CONCURRENCY requests at a time.
+    
+    The default of 35 concurrent requests suits the lowest rate limit tier;
+    raise it for deployments with more quota.
+    
+    Args:
+        openai_client: Azure OpenAI client (thread-safe)
+        texts: Texts to embed
+        model: Embedding deployment name
+        
+    Returns:
+        List[List[float]]: Embedding vector for each text, in input order
+    """
+    def embed_batch(batch: List[str]) -> List[List[float]]:
+        response = openai_client.embeddings.create(input=batch, model=model)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    
+    batches = [texts[i:i + _EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), _EMBEDDING_BATCH_SIZE)]
+    if len(batches) <= 1:
+        return [vector for batch in batches for vector in embed_batch(batch)]
+    
+    concurrency = min(int(os.getenv("OPENAI_CONCURRENCY", "35")), len(batches))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return [vector for vectors in executor.map(embed_batch, batches) for vector in vectors]
+
 @activity("embed_chunks_v1")
 def embed_chunks_v1(chunks: List[str], file_id: str) -> List[Dict[str, Any]]:
     """Generate embeddings for chunks using Azure OpenAI."""
@@ -247,22 +282,17 @@ def embed_chunks_v1(chunks: List[str], file_id: str) -> List[Dict[str, Any]]:
         _, _, openai_client, _, _ = get_azure_clients()
         
         # Get file metadata for additional context
-        file_metadata = db_manager.get_file(file_id)
+        file_metadata = get_db().get_file(file_id)
         if not file_metadata:
             raise ValueError(f"File {file_id} not found in database")
         
         embeddings = []
         deployment_name = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")
         
-        for i, chunk in enumerate(chunks):
-            # Generate embedding
-            response = openai_client.embeddings.create(
-                input=chunk,
-                model=deployment_name
-            )
-            
-            embedding_vector = response.data[0].embedding
-            
+        # Generate embeddings
+        embedding_vectors = embed_texts(openai_client, chunks, deployment_name)
+        
+        for i, (chunk, embedding_vector) in enumerate(zip(chunks, embedding_vectors)):
             # Create document for search index
             document = {
                 "id": f"{file_id}_{i}",
@@ -276,11 +306,11 @@ def embed_chunks_v1(chunks: List[str], file_id: str) -> List[Dict[str, Any]]:
             
             embeddings.append(document)
         
-        logger.info(f"Successfully generated embeddings for {len(chunks)} chunks")
+        logger.info("Successfully generated embeddings for %s chunks", len(chunks))
         return embeddings
         
     except Exception as e:
-        logger.error(f"Failed to generate embeddings: {str(e)}")
+        logger.error("Failed to generate embeddings: %s", e)
         raise
 
 @activity("store_embeddings_v1")
@@ -289,37 +319,37 @@ def store_embeddings_v1(embeddings: List[Dict[str, Any]]) -> bool:
     try:
         _, _, _, search_client, _ = get_azure_clients()
         
-        # Upload documents to search index
-        result = search_client.upload_documents(documents=embeddings)
+        # Upload documents to search index in batches
+        result = upload_documents_batched(search_client, embeddings)
         
         # Check if all documents were successfully uploaded
         success_count = sum(1 for r in result if r.succeeded)
         total_count = len(embeddings)
         
         if success_count == total_count:
-            logger.info(f"Successfully stored {success_count} embeddings in search index")
+            logger.info("Successfully stored %s embeddings in search index", success_count)
             return True
         else:
-            logger.error(f"Only {success_count}/{total_count} embeddings were stored successfully")
+            logger.error("Only %s/%s embeddings were stored successfully", success_count, total_count)
             return False
             
     except Exception as e:
-        logger.error(f"Failed to store embeddings: {str(e)}")
+        logger.error("Failed to store embeddings: %s", e)
         return False
 
 @activity("update_indexing_status_v1")
 def update_indexing_status_v1(file_id: str, status: str, error_message: Optional[str] = None) -> bool:
     """Update the indexing status of the file in the database."""
     try:
-        success = db_manager.update_file_status(file_id, status, error_message)
+        success = get_db().update_file_status(file_id, status, error_message)
         if success:
-            logger.info(f"Updated file {file_id} status to {status}")
+            logger.info("Updated file %s status to %s", file_id, status)
         else:
-            logger.error(f"Failed to update file {file_id} status to {status}")
+            logger.error("Failed to update file %s status to %s", file_id, status)
         return success
         
     except Exception as e:
-        logger.error(f"Failed to update status for file {file_id}: {str(e)}")
+        logger.error("Failed to update status for file %s: %s", file_id, e)
         return False
 
 @workflow("index_file_v1")
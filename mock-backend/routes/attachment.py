@@ -1,20 +1,24 @@
 """Attachment routes for multimodal chat input."""
 import uuid
+import asyncio
 import logging
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Header, status
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, status
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 
-from lib.database import db_manager
+from lib.auth import require_userid
+from lib.database import async_db_manager
 from lib.blob import upload_file_to_blob, get_file_temporary_link, delete_file
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-attachment_routes = APIRouter()
+# orjson encodes the attachment listings several times faster than json.dumps
+attachment_routes = APIRouter(default_response_class=ORJSONResponse)
 
-# Pydantic models for request/response
+# Pydantic models for request/response. Handlers build these themselves, so the
+# routes set response_model=None to skip FastAPI re-validating every response
+# and list the models under responses= to keep them in the OpenAPI schema.
 class AttachmentUploadResponse(BaseModel):
     """Response model for attachment upload."""
     url: str  # file://{id}
@@ -32,11 +36,11 @@ class AttachmentDetailResponse(BaseModel):
     type: str
     metadata: Optional[Dict[str, Any]] = None
 
-@attachment_routes.post("/", response_model=AttachmentUploadResponse)
+@attachment_routes.post("/", response_model=None, responses={200: {"model": AttachmentUploadResponse}})
 async def upload_attachment(
     file: UploadFile = File(...),
-    userid: str | None = Header(None)
-):
+    userid: str = Depends(require_userid)
+) -> AttachmentUploadResponse:
     """
     Upload an attachment.
     
@@ -47,28 +51,21 @@ async def upload_attachment(
     Returns:
         AttachmentUploadResponse with file://{id} URL
     """
-    if not userid:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="userid header is required"
-        )
-    
     try:
         # Generate unique IDs
-        attachment_id = str(uuid.uuid4())
+        attachment_id = uuid.uuid4().hex
         blob_name = f"attachments/{userid}/{attachment_id}_{file.filename}"
         
         # Determine file type
         file_type = file.content_type or "unknown"
         
-        logger.info(f"Uploading attachment: {file.filename} for user {userid} with type {file_type}")
+        logger.info("Uploading attachment: %s for user %s with type %s", file.filename, userid, file_type)
         
-        # Upload to Azure Blob Storage
-        file_content = await file.read()
-        upload_file_to_blob(file_content, blob_name)
+        # Stream the spooled upload to Azure Blob Storage off the event loop
+        await asyncio.to_thread(upload_file_to_blob, file.file, blob_name, file.size)
         
         # Add to attachment database record
-        db_manager.create_attachment(
+        await async_db_manager.create_attachment(
             attachment_id=attachment_id,
             userid=userid,
             filename=file.filename or "unknown",
@@ -76,7 +73,7 @@ async def upload_attachment(
             attachment_type=file_type
         )
         
-        logger.info(f"Attachment uploaded successfully: {attachment_id}")
+        logger.info("Attachment uploaded successfully: %s", attachment_id)
         
         # Return only the file ID in file:// format
         return AttachmentUploadResponse(
@@ -87,18 +84,18 @@ async def upload_attachment(
         )
         
     except Exception as e:
-        logger.error(f"Error uploading attachment: {str(e)}")
+        logger.error("Error uploading attachment: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to upload attachment: {str(e)}"
         )
 
 
-@attachment_routes.get("/{attachment_id}", response_model=AttachmentDetailResponse)
+@attachment_routes.get("/{attachment_id}", response_model=None, responses={200: {"model": AttachmentDetailResponse}})
 async def get_attachment_by_id(
     attachment_id: str,
-    userid: str | None = Header(None)
-):
+    userid: str = Depends(require_userid)
+) -> AttachmentDetailResponse:
     """
     Get attachment details by ID and return a temporary URL with SAS token.
     
@@ -109,15 +106,9 @@ async def get_attachment_by_id(
     Returns:
         AttachmentDetailResponse with blob URL (with SAS token)
     """
-    if not userid:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="userid header is required"
-        )
-    
     try:
         # Get from database
-        attachment = db_manager.get_attachment(attachment_id)
+        attachment = await async_db_manager.get_attachment(attachment_id)
         
         if not attachment:
             raise HTTPException(
@@ -140,7 +131,7 @@ async def get_attachment_by_id(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error retrieving attachment: {str(e)}")
+        logger.error("Error retrieving attachment: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to retrieve attachment: {str(e)}"
@@ -149,7 +140,7 @@ async def get_attachment_by_id(
 
 @attachment_routes.get("/")
 async def get_all_attachments(
-    userid: str | None = Header(None)
+    userid: str = Depends(require_userid)
 ):
     """
     Get all attachments for a user.
@@ -160,33 +151,17 @@ async def get_all_attachments(
     Returns:
         List of all attachments for the user
     """
-    if not userid:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="userid header is required"
-        )
-    
     try:
-        attachments = db_manager.get_user_attachments(userid)
+        attachments = await async_db_manager.get_user_attachments_raw(userid)
         
         return {
             "userid": userid,
             "count": len(attachments),
-            "attachments": [
-                {
-                    "id": att.id,
-                    "filename": att.filename,
-                    "created_at": att.created_at,
-                    "type": att.type,
-                    "metadata": att.metadata,
-                    "url": f"file://{att.id}"
-                }
-                for att in attachments
-            ]
+            "attachments": attachments
         }
         
     except Exception as e:
-        logger.error(f"Error retrieving all attachments for user {userid}: {str(e)}")
+        logger.error("Error retrieving all attachments for user %s: %s", userid, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to retrieve attachments: {str(e)}"
@@ -196,7 +171,7 @@ async def get_all_attachments(
 async def update_attachment_metadata(
     attachment_id: str,
     metadata: Dict[str, Any],
-    userid: str | None = Header(None)
+    userid: str = Depends(require_userid)
 ):
     """
     Update attachment metadata.
@@ -209,30 +184,19 @@ async def update_attachment_metadata(
     Returns:
         Updated attachment details
     """
-    if not userid:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="userid header is required"
-        )
-    
     try:
-        # Verify attachment exists
-        attachment = db_manager.get_attachment(attachment_id)
+        # Update metadata and read back the updated attachment in one statement
+        updated_attachment = await async_db_manager.update_attachment_metadata_and_get(attachment_id, metadata)
         
-        if not attachment:
+        if not updated_attachment:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Attachment not found: {attachment_id}"
             )
         
-        # Update metadata
-        db_manager.update_attachment_metadata(attachment_id, metadata)
-        
-        # Get updated attachment
-        updated_attachment = db_manager.get_attachment(attachment_id)
         blob_url = get_file_temporary_link(updated_attachment.blob_name, expiry=3600)
         
-        logger.info(f"Attachment metadata updated: {attachment_id}")
+        logger.info("Attachment metadata updated: %s", attachment_id)
         
         return {
             "id": updated_attachment.id,
@@ -248,7 +212,7 @@ async def update_attachment_metadata(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error updating attachment metadata: {str(e)}")
+        logger.error("Error updating attachment metadata: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to update metadata: {str(e)}"
@@ -257,7 +221,7 @@ async def update_attachment_metadata(
 @attachment_routes.delete("/{attachment_id}")
 async def delete_attachment(
     attachment_id: str,
-    userid: str | None = Header(None)
+    userid: str = Depends(require_userid)
 ):
     """
     Delete an attachment by ID.
@@ -269,15 +233,9 @@ async def delete_attachment(
     Returns:
         Success message
     """
-    if not userid:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="userid header is required"
-        )
-    
     try:
         # Get from database
-        attachment = db_manager.get_attachment(attachment_id)
+        attachment = await async_db_manager.get_attachment(attachment_id)
         
         if not attachment:
             raise HTTPException(
@@ -285,13 +243,13 @@ async def delete_attachment(
                 detail=f"Attachment not found: {attachment_id}"
             )
         
-        # Delete from blob storage
-        delete_file(attachment.blob_name)
-        
-        # Delete from database
-        db_manager.delete_attachment(attachment_id)
+        # Delete from blob storage and database concurrently, they are independent
+        await asyncio.gather(
+            asyncio.to_thread(delete_file, attachment.blob_name),
+            async_db_manager.delete_attachment(attachment_id)
+        )
         
-        logger.info(f"Attachment deleted successfully: {attachment_id}")
+        logger.info("Attachment deleted successfully: %s", attachment_id)
         
         return {
             "message": "Attachment deleted successfully",
@@ -301,53 +259,8 @@ async def delete_attachment(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error deleting attachment: {str(e)}")
+        logger.error("Error deleting attachment: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete attachment: {str(e)}"
         )
-
-
-@attachment_routes.get("/user")
-async def get_user_attachments(
-    userid: str | None = Header(None)
-):
-    """
-    Get all attachments for a user.
-    
-    Args:
-        userid: User ID from header
-        
-    Returns:
-        List of attachments
-    """
-    if not userid:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="userid header is required"
-        )
-    
-    try:
-        attachments = db_manager.get_user_attachments(userid)
-        
-        return {
-            "userid": userid,
-            "attachments": [
-                {
-                    "id": att.id,
-                    "filename": att.filename,
-                    "created_at": att.created_at,
-                    "type": att.type,
-                    "metadata": att.metadata,
-                    "url": f"file://{att.id}"
-                }
-                for att in attachments
-            ]
-        }
-        
-    except Exception as e:
-        logger.error(f"Error retrieving user attachments: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to retrieve attachments: {str(e)}"
-        )
\ No newline at end of file
@@ -1,4 +1,4 @@
-import json
+import asyncio
 
 from utils.uuid import generate_uuid
 from langchain_core.load import dumps
@@ -6,31 +6,37 @@ from utils.stream_protocol import generate_stream
 from utils.message_conversion import from_assistant_ui_contents_to_langgraph_contents
 from utils.langgraph_content import get_text_from_contents
 
-from typing import Annotated
 from pydantic import BaseModel
-from fastapi.responses import StreamingResponse
-from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException
 
 from agent.graph import graph
-from lib.database import db_manager
+from lib.auth import require_userid_400
+from lib.database import async_db_manager
 
 class ChatRequest(BaseModel):
     messages: list
 
 chat_conversation_route = APIRouter()
 
+# Headers of the chat data stream responses, the same for every request
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Content-Type": "text/plain; charset=utf-8",
+    "Connection": "keep-alive",
+    "x-vercel-ai-data-stream": "v1",
+    "x-vercel-ai-ui-message-stream": "v1"
+}
+
 @chat_conversation_route.post("/chat")
-def chat_completions(request: ChatRequest, userid:  Annotated[str | None, Header()] = None):
+async def chat_completions(request: ChatRequest, userid: str = Depends(require_userid_400)):
     """Chat completions endpoint."""
 
-    if not userid:
-        return {"error": "Missing userid header"}
-
     conversation_id = generate_uuid()
 
     # Convert the input message 
     if type(request.messages) is not list or len(request.messages) == 0:
-        return {"error": "Invalid messages format"}
+        raise HTTPException(status_code=400, detail="Invalid messages format")
     
     last_message = request.messages[-1] if request.messages else ""
     last_message_langgraph_content = from_assistant_ui_contents_to_langgraph_contents(last_message['content'])
@@ -40,40 +46,31 @@ def chat_completions(request: ChatRequest, userid:  Annotated[str | None, Header
     }]
 
     # Extract title from the first message content
-    title = get_text_from_contents(last_message['content'])
+    full_text = get_text_from_contents(last_message['content'])
     # Limit title length and provide a default if empty
-    if not title:
+    if not full_text:
         title = "New Conversation"
     else:
         # Truncate title to first 50 characters for display
-        title = title[:50].strip()
-        if len(title) < len(get_text_from_contents(last_message['content'])):
+        title = full_text[:50].strip()
+        if len(title) < len(full_text):
             title += "..."
 
     # Add user and the conversation id to the database with title
-    db_manager.create_conversation(conversation_id, userid, title)
+    await async_db_manager.create_conversation(conversation_id, userid, title)
 
     return StreamingResponse(
-        generate_stream(graph, input_message, conversation_id),
+        generate_stream(graph, input_message, conversation_id, userid),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Content-Type": "text/plain; charset=utf-8",
-            "Connection": "keep-alive",
-            "x-vercel-ai-data-stream": "v1",
-            "x-vercel-ai-ui-message-stream": "v1"
-        }
+        headers=SSE_HEADERS
     )
 
 
 @chat_conversation_route.get("/last-conversation-id")
-def get_last_conversation_id( userid:  Annotated[str | None, Header()] = None):
+async def get_last_conversation_id( userid: str = Depends(require_userid_400)):
     """Get last conversation ID endpoint."""
-    if not userid:
-        return {"error": "Missing userid header"}
-    
     # Fetch the last conversation ID for the user from the database
-    last_conversation_id = db_manager.get_last_conversation_id(userid)
+    last_conversation_id = await async_db_manager.get_last_conversation_id(userid)
 
     return {
         "userId": userid,
@@ -81,73 +78,52 @@ def get_last_conversation_id( userid:  Annotated[str | None, Header()] = None):
     }
 
 @chat_conversation_route.get("/conversations")
-def get_conversations(userid:  Annotated[str | None, Header()] = None):
-    """Get conversations endpoint."""
-    if not userid:
-        return {"error": "Missing userid header"}
-
-    # Fetch list of conversations for the user from the database
-    conversations = db_manager.get_user_conversations(userid)
-    
-    # Convert to the expected API response format
-    response = []
-    for conv in conversations:
-        response.append({
-            "id": conv.id,
-            "title": conv.title,
-            "last_used_at": conv.last_used_at,
-            "is_pinned": conv.is_pinned
-        })
-    
-    return response
+async def get_conversations(userid: str = Depends(require_userid_400), limit: int | None = None, offset: int = 0):
+    """Get conversations endpoint. Optional limit/offset query params return one page."""
+    # Fetch list of conversations for the user, already in the API response format
+    return await async_db_manager.get_user_conversations_raw(userid, limit=limit, offset=offset)
 
 @chat_conversation_route.get("/conversations/{conversation_id}")
-def get_chat_history(userid:  Annotated[str | None, Header()] = None, conversation_id: str = ""):
+async def get_chat_history(userid: str = Depends(require_userid_400), conversation_id: str = ""):
     """Get chat history for a conversation."""
-    if not userid:
-        return {"error": "Missing userid header"}
-    
-    # Check if the conversation exists and belongs to the user
-    if not db_manager.conversation_exists(conversation_id, userid):
+    # Update last_used_at timestamp for the conversation. The update only
+    # matches a conversation that belongs to the user, so no row means not found.
+    if not await async_db_manager.update_conversation_last_used(conversation_id, userid):
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    # Update last_used_at timestamp for the conversation
-    db_manager.update_conversation_last_used(conversation_id, userid)
-    
     # Fetch chat history for the conversation from LangGraph state
     try:
         # Get the conversation state from the checkpointer
-        states_generator = graph.get_state_history(config={"configurable": {"thread_id": conversation_id}})
-        states = list(states_generator)
-
-        json_dumps = dumps(states)
-        
-        return json.loads(json_dumps)
+        states = [
+            state
+            async for state in graph.aget_state_history(config={"configurable": {"thread_id": conversation_id}})
+        ]
+
+        # Serializing a long history is CPU bound, keep it off the event loop.
+        # The serialized string is sent as is rather than parsed back into
+        # Python objects for FastAPI to encode a second time.
+        content = await asyncio.to_thread(dumps, states)
+        return Response(content=content, media_type="application/json")
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch chat history: {str(e)}")
 
 @chat_conversation_route.post("/conversations/{conversation_id}/chat")
-def chat_conversation( userid: Annotated[str | None, Header()] = None, conversation_id: str = "", request: ChatRequest = None):
+async def chat_conversation( userid: str = Depends(require_userid_400), conversation_id: str = "", request: ChatRequest = None):
     """Chat in a specific conversation."""
 
-    if not userid:
-        return {"error": "Missing userid header"}
-    
     if not request:
-        return {"error": "Missing request body"}
+        raise HTTPException(status_code=400, detail="Missing request body")
 
 
-    # Check if the conversation exists and belongs to the user
-    if not db_manager.conversation_exists(conversation_id, userid):
+    # Update last_used_at timestamp for the conversation. The update only
+    # matches a conversation that belongs to the user, so no row means not found.
+    if not await async_db_manager.update_conversation_last_used(conversation_id, userid):
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    # Update last_used_at timestamp for the conversation
-    db_manager.update_conversation_last_used(conversation_id, userid)
-    
     # Convert the input message 
     if type(request.messages) is not list or len(request.messages) == 0:
-        return {"error": "Invalid messages format"}
+        raise HTTPException(status_code=400, detail="Invalid messages format")
     
     last_message = request.messages[-1] if request.messages else ""
     last_message_langgraph_content = from_assistant_ui_contents_to_langgraph_contents(last_message['content'])
@@ -157,25 +133,16 @@ def chat_conversation( userid: Annotated[str | None, Header()] = None, conversat
     }]
 
     return StreamingResponse(
-        generate_stream(graph, input_message, conversation_id),
+        generate_stream(graph, input_message, conversation_id, userid),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Content-Type": "text/plain; charset=utf-8",
-            "Connection": "keep-alive",
-            "x-vercel-ai-data-stream": "v1",
-            "x-vercel-ai-ui-message-stream": "v1"
-        }
+        headers=SSE_HEADERS
     )
 @chat_conversation_route.delete("/conversations/{conversation_id}")
-def delete_conversation(userid: Annotated[str | None, Header()] = None, conversation_id: str = ""):
+async def delete_conversation(userid: str = Depends(require_userid_400), conversation_id: str = ""):
     """Delete a conversation."""
 
-    if not userid:
-        return {"error": "Missing userid header"}
-
     # Delete the conversation from the database
-    deleted = db_manager.delete_conversation(conversation_id, userid)
+    deleted = await async_db_manager.delete_conversation(conversation_id, userid)
     
     if not deleted:
         raise HTTPException(status_code=404, detail="Conversation not found")
@@ -183,18 +150,15 @@ def delete_conversation(userid: Annotated[str | None, Header()] = None, conversa
     return {"message": "Conversation deleted successfully"}
 
 @chat_conversation_route.post("/conversations/{conversation_id}/pin")
-def pin_conversation(userid: Annotated[str | None, Header()] = None, conversation_id: str = ""):
+async def pin_conversation(userid: str = Depends(require_userid_400), conversation_id: str = ""):
     """Pin or unpin a conversation."""
 
-    if not userid:
-        return {"error": "Missing userid header"}
-    
-    existing_data = db_manager.get_conversation(conversation_id, userid)
+    existing_data = await async_db_manager.get_conversation(conversation_id, userid)
     if not existing_data:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
     # Pin or unpin the conversation in the database
-    updated = db_manager.pin_conversation(conversation_id, userid, not existing_data.is_pinned)
+    updated = await async_db_manager.pin_conversation(conversation_id, userid, not existing_data.is_pinned)
     
     if not updated:
         raise HTTPException(status_code=404, detail="Conversation not found")
@@ -207,21 +171,18 @@ class RenameRequest(BaseModel):
     new_title: str
 
 @chat_conversation_route.post("/conversations/{conversation_id}/rename")
-def rename_conversation(userid: Annotated[str | None, Header()] = None, conversation_id: str = "", request: RenameRequest = None):
+async def rename_conversation(userid: str = Depends(require_userid_400), conversation_id: str = "", request: RenameRequest = None):
     """Rename a conversation."""
 
-    if not userid:
-        return {"error": "Missing userid header"}
-    
     if not request or not request.new_title or request.new_title.strip() == "":
-        return {"error": "new_title cannot be empty"}
+        raise HTTPException(status_code=400, detail="new_title cannot be empty")
     
-    existing_data = db_manager.get_conversation(conversation_id, userid)
+    existing_data = await async_db_manager.get_conversation(conversation_id, userid)
     if not existing_data:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
     # Update the conversation title in the database
-    updated = db_manager.update_conversation_title(conversation_id, userid, request.new_title.strip())
+    updated = await async_db_manager.update_conversation_title(conversation_id, userid, request.new_title.strip())
     
     if not updated:
         raise HTTPException(status_code=404, detail="Conversation not found")
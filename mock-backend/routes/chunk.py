@@ -1,19 +1,16 @@
-import os
 import uuid
 import logging
-from typing import List, Annotated
-from fastapi import APIRouter, HTTPException, Depends, Header
+from typing import Dict, List
+from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from azure.core.exceptions import ResourceNotFoundError
 from pydantic import BaseModel
-from azure.storage.blob import generate_blob_sas, BlobSasPermissions
-from lib.database import db_manager, FileMetadata
-from datetime import datetime, timedelta
+from lib.auth import require_userid_400
+from lib.database import async_db_manager, FileMetadata
 
-from lib.search import get_search_client
-from lib.blob import get_blob_service_client
+from lib.search import get_async_search_client
+from lib.blob import get_file_temporary_link, get_file_temporary_links
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 chunk_route = APIRouter()
@@ -39,13 +36,19 @@ class ChunkDetailResponse(BaseModel):
     metadata: dict
     file_url: str
 
+class ChunkBatchRequest(BaseModel):
+    chunk_ids: List[str]
+
+# An Azure AI Search query returns at most 1000 documents
+MAX_BATCH_CHUNKS = 1000
+
 
 
 @chunk_route.get("/{chunk_id}", response_model=ChunkDetailResponse)
-def get_chunk_detail(
+async def get_chunk_detail(
     chunk_id: str,
     credentials: HTTPBasicCredentials = Depends(security),
-    userid: Annotated[str | None, Header()] = None,
+    userid: str = Depends(require_userid_400),
 ):
     """
     Use Azure AI Search to get the chunk detail by chunk_id.
@@ -53,27 +56,19 @@ def get_chunk_detail(
     Also add a temporary Blob link using SAS Token to the original file if possible. Using the file_id field in the chunk metadata.
     """
     try:
-        # Verify authentication
-        if not userid:
-            raise HTTPException(status_code=400, detail="Missing userid header")
         user_id = userid
         
         # Get chunk from Azure AI Search
-        search_client = get_search_client()
-        results = list(search_client.search(
-            search_text="*",
-            filter=f"id eq '{chunk_id}'",
-            top=1
-        ))
-        
-        if not results or len(results) < 1:
+        search_client = await get_async_search_client()
+        try:
+            chunk = await search_client.get_document(key=chunk_id)
+        except ResourceNotFoundError:
             raise HTTPException(status_code=404, detail="Chunk not found")
         
-        chunk = results[0]
         content = chunk['content']
         metadata = dict(chunk)  # Convert to dict for response
 
-        print("MASUK SINI", chunk, content, metadata)
+        logger.debug("Fetched chunk %s of file %s", chunk_id, metadata.get('file_id'))
         
         # Extract file_id from metadata
         file_id = metadata.get('file_id')
@@ -81,7 +76,7 @@ def get_chunk_detail(
             raise HTTPException(status_code=404, detail="File ID not found in chunk metadata")
         
         # Get file metadata from database
-        file_metadata = db_manager.get_file(file_id)
+        file_metadata = await async_db_manager.get_file(file_id)
         if not file_metadata:
             raise HTTPException(status_code=404, detail="File not found")
         
@@ -89,25 +84,8 @@ def get_chunk_detail(
         if file_metadata.userid != user_id:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        # Generate SAS token for the blob
-        blob_service = get_blob_service_client()
-        container_name = os.getenv("AZURE_STORAGE_CONTAINER_NAME")
-        blob_client = blob_service.get_blob_client(
-            container=container_name,
-            blob=file_metadata.blob_name
-        )
-        
-        # Generate SAS URL with read permission, expires in 1 hour
-        sas_token = generate_blob_sas(
-            account_name=blob_service.account_name,
-            container_name=container_name,
-            blob_name=file_metadata.blob_name,
-            account_key=blob_service.credential.account_key,
-            permission=BlobSasPermissions(read=True),
-            expiry=datetime.utcnow() + timedelta(hours=1)
-        )
-        
-        file_url = f"https://{blob_service.account_name}.blob.core.windows.net/{container_name}/{file_metadata.blob_name}?{sas_token}"
+        # Get the file with SAS token (valid for 1 hour)
+        file_url = get_file_temporary_link(file_metadata.blob_name, expiry=3600)
         
         return ChunkDetailResponse(
             content=content,
@@ -118,5 +96,66 @@ def get_chunk_detail(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to get chunk detail: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to get chunk detail: {str(e)}")
\ No newline at end of file
+        logger.error("Failed to get chunk detail: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to get chunk detail: {str(e)}")
+
+
+@chunk_route.post("/batch", response_model=Dict[str, ChunkDetailResponse])
+async def get_chunk_details_batch(
+    request: ChunkBatchRequest,
+    credentials: HTTPBasicCredentials = Depends(security),
+    userid: str = Depends(require_userid_400),
+):
+    """
+    Get the details of several chunks at once, keyed by chunk_id.
+    
+    Uses one Azure AI Search query, one database query and one SAS batch for
+    all chunks instead of a round trip of each per chunk. Chunks that don't
+    exist or belong to another user's file are left out.
+    """
+    try:
+        user_id = userid
+        
+        chunk_ids = list(dict.fromkeys(request.chunk_ids))
+        if not chunk_ids:
+            return {}
+        if len(chunk_ids) > MAX_BATCH_CHUNKS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_CHUNKS} chunk_ids per request")
+        
+        # Get all chunks from Azure AI Search. search.in takes the values as one
+        # OData string literal, in which quotes are escaped by doubling them
+        search_client = await get_async_search_client()
+        id_list = ",".join(chunk_ids).replace("'", "''")
+        chunks = [chunk async for chunk in await search_client.search(
+            search_text="*",
+            filter=f"search.in(id, '{id_list}', ',')",
+            top=len(chunk_ids)
+        )]
+        
+        # Get the metadata of the files the chunks belong to, keeping the user's own
+        files = await async_db_manager.get_files_by_ids(
+            chunk['file_id'] for chunk in chunks if chunk.get('file_id')
+        )
+        files = {file_id: file for file_id, file in files.items() if file.userid == user_id}
+        
+        # Get the files with SAS tokens (valid for 1 hour)
+        file_urls = get_file_temporary_links((file.blob_name for file in files.values()), expiry=3600)
+        
+        details = {}
+        for chunk in chunks:
+            file_metadata = files.get(chunk.get('file_id'))
+            if not file_metadata:
+                continue
+            details[chunk['id']] = ChunkDetailResponse(
+                content=chunk['content'],
+                metadata=dict(chunk),
+                file_url=file_urls[file_metadata.blob_name]
+            )
+        
+        return details
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Failed to get chunk details: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to get chunk details: {str(e)}")
@@ -1,18 +1,18 @@
 import os
 import uuid
+import asyncio
 import logging
-from typing import List, Annotated
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Header
+from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from pydantic import BaseModel
-from lib.database import db_manager, FileMetadata
+from lib.auth import require_userid_400
+from lib.database import get_db, async_db_manager, FileMetadata
 from orchestration import get_orchestrator
 
 from lib.blob import get_blob_service_client
-from lib.search import get_search_client
+from lib.search import get_async_search_client
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 file_indexing_route = APIRouter()
@@ -41,20 +41,17 @@ class ChunkDetailResponse(BaseModel):
 @file_indexing_route.post("/", response_model=FileUploadResponse)
 async def upload_file(
     file: UploadFile = File(...),
-    userid:  Annotated[str | None, Header()] = None,
+    userid: str = Depends(require_userid_400),
     credentials: HTTPBasicCredentials = Depends(security)
 ):
     """Upload file to blob storage and start indexing workflow."""
     try:
-        if not userid:
-            raise HTTPException(status_code=400, detail="Missing userid header")
-        
         # Validate file
         if not file.filename:
             raise HTTPException(status_code=400, detail="No file provided")
         
         # Generate unique file ID and blob name
-        file_id = str(uuid.uuid4())
+        file_id = uuid.uuid4().hex
         blob_name = f"{userid}/{file_id}_{file.filename}"
         
         # Upload to Azure Blob Storage
@@ -73,12 +70,11 @@ async def upload_file(
             blob=blob_name
         )
         
-        file_content = await file.read()
-
-        blob_client.upload_blob(file_content, overwrite=True)
+        # Stream the spooled upload off the event loop instead of reading it into memory
+        await asyncio.to_thread(blob_client.upload_blob, file.file, length=file.size, overwrite=True)
         
         # Create file metadata in database
-        file_metadata = db_manager.create_file(
+        file_metadata = await async_db_manager.create_file(
             file_id=file_id,
             userid=userid,
             filename=file.filename,
@@ -94,12 +90,12 @@ async def upload_file(
             )
             
             # Update file metadata with workflow ID
-            db_manager.update_file_workflow_id(file_id, workflow_id)
-            logger.info(f"Started indexing workflow for file {file_id}, workflow_id: {workflow_id}")
+            await async_db_manager.update_file_workflow_id(file_id, workflow_id)
+            logger.info("Started indexing workflow for file %s, workflow_id: %s", file_id, workflow_id)
         except Exception as e:
-            logger.error(f"Failed to start indexing workflow: {str(e)}")
+            logger.error("Failed to start indexing workflow: %s", e)
             # Update status to failed
-            db_manager.update_file_status(file_id, "failed", f"Failed to start indexing: {str(e)}")
+            await async_db_manager.update_file_status(file_id, "failed", f"Failed to start indexing: {str(e)}")
         
         return FileUploadResponse(
             file_id=file_id,
@@ -111,30 +107,27 @@ async def upload_file(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"File upload failed: {str(e)}")
+        logger.error("File upload failed: %s", e)
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 
 @file_indexing_route.get("/", response_model=FileListResponse)
-def list_files(credentials: HTTPBasicCredentials = Depends(security), userid:  Annotated[str | None, Header()] = None,):
-    """List all files for the authenticated user with real-time workflow status."""
+def list_files(credentials: HTTPBasicCredentials = Depends(security), userid: str = Depends(require_userid_400), limit: int | None = None, offset: int = 0):
+    """List files for the authenticated user with real-time workflow status. Optional limit/offset query params return one page."""
     try:
-        if not userid:
-            raise HTTPException(status_code=400, detail="Missing userid header")
+        # Get user files from database as plain dicts
+        files = get_db().get_user_files_raw(userid, limit=limit, offset=offset)
         
-        # Get user files from database
-        files = db_manager.get_user_files(userid)
-        
-        # Update status for files with workflow IDs
-        updated_files = []
+        # Update status for files with workflow IDs; changes are written in one transaction
+        status_updates = []
         for file_metadata in files:
-            if file_metadata.workflow_id:
+            if file_metadata["workflow_id"]:
                 try:
                     orchestrator = get_orchestrator()
-                    workflow_status = orchestrator.get_workflow_status(workflow_id=file_metadata.workflow_id)
+                    workflow_status = orchestrator.get_workflow_status(workflow_id=file_metadata["workflow_id"])
                     
                     # Map workflow status to file status
-                    new_status = file_metadata.status
-                    new_error = file_metadata.error_message
+                    new_status = file_metadata["status"]
+                    new_error = file_metadata["error_message"]
                     
                     if workflow_status.get('status') == 'running':
                         new_status = 'in_progress'
@@ -145,39 +138,38 @@ def list_files(credentials: HTTPBasicCredentials = Depends(security), userid:  A
                         new_error = workflow_status.get('error', 'Workflow failed')
                     
                     # Update database if status changed
-                    if new_status != file_metadata.status:
-                        db_manager.update_file_status(file_metadata.file_id, new_status, new_error)
-                        file_metadata.status = new_status
-                        file_metadata.error_message = new_error
+                    if new_status != file_metadata["status"]:
+                        status_updates.append((file_metadata["file_id"], new_status, new_error))
+                        file_metadata["status"] = new_status
+                        file_metadata["error_message"] = new_error
                         
                 except Exception as e:
-                    logger.warning(f"Failed to get workflow status for {file_metadata.file_id}: {str(e)}")
+                    logger.warning("Failed to get workflow status for %s: %s", file_metadata['file_id'], e)
                     # Continue with database status if workflow status check fails
-            
-            updated_files.append(file_metadata)
         
-        return FileListResponse(files=updated_files)
+        try:
+            get_db().update_file_statuses_bulk(status_updates)
+        except Exception as e:
+            logger.warning("Failed to store refreshed file statuses: %s", e)
+        
+        return {"files": files}
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to list files: {str(e)}")
+        logger.error("Failed to list files: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to list files: {str(e)}")
 
 @file_indexing_route.get("/{file_id}", response_model=FileMetadata)
 def get_file_status(
     file_id: str,
     credentials: HTTPBasicCredentials = Depends(security),
-    userid:  Annotated[str | None, Header()] = None,
+    userid: str = Depends(require_userid_400),
 ):
     """Get the status of a specific file with real-time workflow status."""
     try:
-        # Verify authentication
-        if not userid:
-            raise HTTPException(status_code=400, detail="Missing userid header")
-        
         # Get file metadata
-        file_metadata = db_manager.get_file(file_id)
+        file_metadata = get_db().get_file(file_id)
         if not file_metadata:
             raise HTTPException(status_code=404, detail="File not found")
         
@@ -194,21 +186,21 @@ def get_file_status(
                 # Map workflow status to file status
                 if workflow_status.get('status') == 'running':
                     if file_metadata.status != 'in_progress':
-                        db_manager.update_file_status(file_id, 'in_progress')
+                        get_db().update_file_status(file_id, 'in_progress')
                         file_metadata.status = 'in_progress'
                 elif workflow_status.get('status') == 'completed':
                     if file_metadata.status != 'completed':
-                        db_manager.update_file_status(file_id, 'completed')
+                        get_db().update_file_status(file_id, 'completed')
                         file_metadata.status = 'completed'
                 elif workflow_status.get('status') == 'failed':
                     error_msg = workflow_status.get('error', 'Workflow failed')
                     if file_metadata.status != 'failed':
-                        db_manager.update_file_status(file_id, 'failed', error_msg)
+                        get_db().update_file_status(file_id, 'failed', error_msg)
                         file_metadata.status = 'failed'
                         file_metadata.error_message = error_msg
                         
             except Exception as e:
-                logger.warning(f"Failed to get workflow status for {file_id}: {str(e)}")
+                logger.warning("Failed to get workflow status for %s: %s", file_id, e)
                 # Continue with database status if workflow status check fails
         
         return file_metadata
@@ -216,24 +208,21 @@ def get_file_status(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to get file status: {str(e)}")
+        logger.error("Failed to get file status: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to get file status: {str(e)}")
 
 @file_indexing_route.delete("/{file_id}", response_model=FileDeleteResponse)
 async def delete_file(
     file_id: str,
     credentials: HTTPBasicCredentials = Depends(security),
-    userid:  Annotated[str | None, Header()] = None,
+    userid: str = Depends(require_userid_400),
 ):
     """Delete indexed file, its embeddings, and blob storage."""
     try:
-        # Verify authentication
-        if not userid:
-            raise HTTPException(status_code=400, detail="Missing userid header")
         user_id = userid
 
         # Get file metadata
-        file_metadata = db_manager.get_file(file_id)
+        file_metadata = await async_db_manager.get_file(file_id)
         if not file_metadata:
             raise HTTPException(status_code=404, detail="File not found")
         
@@ -243,21 +232,26 @@ async def delete_file(
         
         # Delete from Azure AI Search (all chunks for this file)
         try:
-            search_client = get_search_client()
+            search_client = await get_async_search_client()
             
             # Search for all documents with this file_id
-            results = search_client.search(
+            results = await search_client.search(
                 search_text="*",
-                filter=f"file_id eq '{file_id}'"
+                filter=f"file_id eq '{file_id}'",
+                select=["id"]
             )
             
             # Delete all chunks
-            doc_ids = [doc["id"] for doc in results]
+            doc_ids = [doc["id"] async for doc in results]
             if doc_ids:
-                search_client.delete_documents([{"id": doc_id} for doc_id in doc_ids])
-                logger.info(f"Deleted {len(doc_ids)} chunks from search index for file {file_id}")
+                # An indexing request takes at most 1000 documents
+                await asyncio.gather(*(
+                    search_client.delete_documents([{"id": doc_id} for doc_id in doc_ids[i:i + 1000]])
+                    for i in range(0, len(doc_ids), 1000)
+                ))
+                logger.info("Deleted %s chunks from search index for file %s", len(doc_ids), file_id)
         except Exception as e:
-            logger.warning(f"Failed to delete from search index: {str(e)}")
+            logger.warning("Failed to delete from search index: %s", e)
         
         # Delete from Azure Blob Storage
         try:
@@ -268,12 +262,12 @@ async def delete_file(
                 blob=file_metadata.blob_name
             )
             blob_client.delete_blob()
-            logger.info(f"Deleted blob {file_metadata.blob_name}")
+            logger.info("Deleted blob %s", file_metadata.blob_name)
         except Exception as e:
-            logger.warning(f"Failed to delete blob: {str(e)}")
+            logger.warning("Failed to delete blob: %s", e)
         
         # Delete from database
-        success = db_manager.delete_file(file_id, user_id)
+        success = await async_db_manager.delete_file(file_id, user_id)
         
         if success:
             return FileDeleteResponse(
@@ -287,24 +281,21 @@ async def delete_file(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to delete file: {str(e)}")
+        logger.error("Failed to delete file: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to delete file: {str(e)}")
 
 @file_indexing_route.post("/{file_id}/reindex")
 async def reindex_file(
     file_id: str,
     credentials: HTTPBasicCredentials = Depends(security),
-    userid:  Annotated[str | None, Header()] = None,
+    userid: str = Depends(require_userid_400),
 ):
     """Trigger re-indexing of a file."""
     try:
-        # Verify authentication
-        if not userid:
-            raise HTTPException(status_code=400, detail="Missing userid header")
         user_id = userid
         
         # Get file metadata
-        file_metadata = db_manager.get_file(file_id)
+        file_metadata = await async_db_manager.get_file(file_id)
         if not file_metadata:
             raise HTTPException(status_code=404, detail="File not found")
         
@@ -313,7 +304,7 @@ async def reindex_file(
             raise HTTPException(status_code=403, detail="Access denied")
         
         # Reset status to pending
-        db_manager.update_file_status(file_id, "pending")
+        await async_db_manager.update_file_status(file_id, "pending")
         
         # Start indexing workflow
         orchestrator = get_orchestrator()
@@ -323,8 +314,8 @@ async def reindex_file(
         )
         
         # Update file metadata with new workflow ID
-        db_manager.update_file_workflow_id(file_id, workflow_id)
-        logger.info(f"Started re-indexing workflow for file {file_id}, workflow_id: {workflow_id}")
+        await async_db_manager.update_file_workflow_id(file_id, workflow_id)
+        logger.info("Started re-indexing workflow for file %s, workflow_id: %s", file_id, workflow_id)
         
         return {
             "file_id": file_id,
@@ -336,24 +327,21 @@ async def reindex_file(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to start re-indexing: {str(e)}")
+        logger.error("Failed to start re-indexing: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to start re-indexing: {str(e)}")
 
 @file_indexing_route.get("/{file_id}/workflow-status")
 def get_workflow_status(
     file_id: str,
     credentials: HTTPBasicCredentials = Depends(security),
-    userid:  Annotated[str | None, Header()] = None,
+    userid: str = Depends(require_userid_400),
 ):
     """Get the workflow status for a specific file."""
     try:
-        # Verify authentication
-        if not userid:
-            raise HTTPException(status_code=400, detail="Missing userid header")
         user_id = userid
         
         # Get file metadata
-        file_metadata = db_manager.get_file(file_id)
+        file_metadata = get_db().get_file(file_id)
         if not file_metadata:
             raise HTTPException(status_code=404, detail="File not found")
         
@@ -392,5 +380,5 @@ def get_workflow_status(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to get workflow status: {str(e)}")
+        logger.error("Failed to get workflow status: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to get workflow status: {str(e)}")
@@ -1,17 +1,168 @@
-from typing import List
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, Iterator, List, Set
 from langchain_core.messages import BaseMessage, AIMessage, ToolMessage, HumanMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+logger = logging.getLogger(__name__)
+
+# Per-message token counts keyed by message id. Checkpointed messages are not
+# edited after they are added, so each one only has to be counted once instead
+# of on every turn. Bounded LRU so long-running processes don't grow forever.
+_TOKEN_COUNT_CACHE: "OrderedDict[str, int]" = OrderedDict()
+_TOKEN_COUNT_CACHE_MAX_SIZE = 50_000
+_token_count_lock = threading.Lock()
 
 
 def get_text_from_contents(contents: list[dict]) -> str:
     """Extract text from message contents."""
     if isinstance(contents, list):
-        texts = [item['text'] for item in contents if item['type'] == 'text']
-        return "\n".join(texts)
+        return "\n".join(item['text'] for item in contents if item.get('type') == 'text')
     elif isinstance(contents, str):
         return contents
     return ""
 
 
+def count_tokens_cached(messages: List[BaseMessage]) -> int:
+    """
+    Approximate token count of messages, memoized per message id.
+    
+    Drop-in replacement for count_tokens_approximately: the count of a list is
+    the sum of its per-message counts, and messages without an id are always
+    counted afresh.
+    
+    Args:
+        messages: List of BaseMessage objects to count
+        
+    Returns:
+        int: Approximate number of tokens
+    """
+    total = 0
+    for message in messages:
+        if message.id is None:
+            total += count_tokens_approximately([message])
+            continue
+        
+        with _token_count_lock:
+            count = _TOKEN_COUNT_CACHE.get(message.id)
+            if count is not None:
+                _TOKEN_COUNT_CACHE.move_to_end(message.id)
+        
+        if count is None:
+            count = count_tokens_approximately([message])
+            with _token_count_lock:
+                _TOKEN_COUNT_CACHE[message.id] = count
+                if len(_TOKEN_COUNT_CACHE) > _TOKEN_COUNT_CACHE_MAX_SIZE:
+                    _TOKEN_COUNT_CACHE.popitem(last=False)
+        
+        total += count
+    return total
+
+
+def trim_messages_to_token_limit(
+    messages: List[BaseMessage],
+    max_tokens: int,
+    token_counter: Callable[[List[BaseMessage]], int] = count_tokens_cached,
+) -> List[BaseMessage]:
+    """
+    Keep the most recent messages that fit within a token budget.
+    
+    Equivalent to trim_messages(strategy="last", start_on="human", end_on=("human", "tool")),
+    but walks backwards once, counting each kept message a single time and
+    stopping as soon as the budget is exhausted.
+    
+    Args:
+        messages: List of BaseMessage objects from the conversation state
+        max_tokens: Maximum number of tokens to keep
+        token_counter: Function returning the token count of a list of messages
+        
+    Returns:
+        List[BaseMessage]: Trimmed list of messages
+    """
+    # The kept window must end on a human or tool message
+    end = len(messages)
+    while end > 0 and not isinstance(messages[end - 1], (HumanMessage, ToolMessage)):
+        end -= 1
+    
+    # Grow the window backwards while it fits in the budget
+    start = end
+    total_tokens = 0
+    while start > 0:
+        total_tokens += token_counter([messages[start - 1]])
+        if total_tokens > max_tokens:
+            break
+        start -= 1
+    
+    # The kept window must start on a human message
+    while start < end and not isinstance(messages[start], HumanMessage):
+        start += 1
+    
+    return messages[start:end]
+
+
+def iter_sanitized_messages(messages: Iterable[BaseMessage]) -> Iterator[BaseMessage]:
+    """
+    Lazily sanitize a message list to ensure proper tool call/response pairing.
+    
+    Yields messages in order so callers can chain further per-message processing
+    into the same pass. See sanitize_and_validate_messages for the rules applied.
+    
+    Single forward pass: an AIMessage with tool calls is held back together with
+    the ToolMessages that answer it, and released (or dropped if some calls went
+    unanswered) when the next non-tool message arrives.
+    
+    Args:
+        messages: BaseMessage objects from the conversation state (any iterable)
+        
+    Yields:
+        BaseMessage: Messages safe for OpenAI API
+    """
+    pending_ai = None  # AIMessage with tool calls waiting for its responses
+    pending_tools = []
+    expected_ids = set()
+    found_ids = set()
+    
+    for message in messages:
+        if isinstance(message, ToolMessage):
+            if pending_ai is None:
+                # Skip orphaned ToolMessages (shouldn't happen with proper sequencing, but safety check)
+                logger.debug("Skipping orphaned ToolMessage: %s", message.tool_call_id)
+            elif message.tool_call_id in expected_ids:
+                found_ids.add(message.tool_call_id)
+                pending_tools.append(message)
+            continue
+        
+        # Any other message ends the tool responses of the held AIMessage.
+        # Only include it and its ToolMessages if ALL tool calls have responses
+        if pending_ai is not None:
+            if found_ids == expected_ids:
+                yield pending_ai
+                yield from pending_tools
+            else:
+                logger.debug("Skipping incomplete tool call sequence. Missing responses for: %s", expected_ids - found_ids)
+            pending_ai = None
+        
+        if isinstance(message, AIMessage) and message.tool_calls:
+            # Hold the AIMessage until its tool responses have been seen
+            pending_ai = message
+            pending_tools = []
+            expected_ids = {tc['id'] for tc in message.tool_calls}
+            found_ids = set()
+        elif isinstance(message, (HumanMessage, SystemMessage, AIMessage)):
+            yield message
+        else:
+            # Unknown message type, skip
+            logger.debug("Skipping unknown message type: %s", type(message))
+    
+    if pending_ai is not None:
+        if found_ids == expected_ids:
+            yield pending_ai
+            yield from pending_tools
+        else:
+            logger.debug("Skipping incomplete tool call sequence. Missing responses for: %s", expected_ids - found_ids)
+
+
 def sanitize_and_validate_messages(messages: List[BaseMessage]) -> List[BaseMessage]:
     """
     Sanitize and validate message list to ensure proper tool call/response pairing.
@@ -31,56 +182,7 @@ def sanitize_and_validate_messages(messages: List[BaseMessage]) -> List[BaseMess
     if not messages:
         return messages
     
-    sanitized_messages = []
-    i = 0
-    
-    while i < len(messages):
-        current_message = messages[i]
-        
-        # Handle AIMessage with tool calls
-        if isinstance(current_message, AIMessage) and hasattr(current_message, 'tool_calls') and current_message.tool_calls:
-            tool_call_ids = {tc['id'] for tc in current_message.tool_calls}
-            
-            # Look ahead to find corresponding ToolMessages
-            j = i + 1
-            found_tool_responses = set()
-            tool_messages = []
-            
-            # Collect all consecutive ToolMessages that respond to this AIMessage
-            while j < len(messages) and isinstance(messages[j], ToolMessage):
-                tool_msg = messages[j]
-                if hasattr(tool_msg, 'tool_call_id') and tool_msg.tool_call_id in tool_call_ids:
-                    found_tool_responses.add(tool_msg.tool_call_id)
-                    tool_messages.append(tool_msg)
-                j += 1
-            
-            # Only include this AIMessage and its ToolMessages if ALL tool calls have responses
-            if found_tool_responses == tool_call_ids:
-                sanitized_messages.append(current_message)
-                sanitized_messages.extend(tool_messages)
-                i = j  # Skip past the tool messages we just processed
-            else:
-                # Skip this incomplete tool call sequence
-                print(f"Skipping incomplete tool call sequence. Missing responses for: {tool_call_ids - found_tool_responses}")
-                i = j  # Skip past any partial tool messages
-        
-        # Handle other message types (HumanMessage, SystemMessage, AIMessage without tool calls)
-        elif isinstance(current_message, (HumanMessage, SystemMessage)) or \
-             (isinstance(current_message, AIMessage) and (not hasattr(current_message, 'tool_calls') or not current_message.tool_calls)):
-            sanitized_messages.append(current_message)
-            i += 1
-        
-        # Skip orphaned ToolMessages (shouldn't happen with proper sequencing, but safety check)
-        elif isinstance(current_message, ToolMessage):
-            print(f"Skipping orphaned ToolMessage: {current_message.tool_call_id}")
-            i += 1
-        
-        else:
-            # Unknown message type, skip
-            print(f"Skipping unknown message type: {type(current_message)}")
-            i += 1
-    
-    return sanitized_messages
+    return list(iter_sanitized_messages(messages))
 
 
 def validate_message_sequence(messages: List[BaseMessage]) -> bool:
@@ -111,12 +213,44 @@ def validate_message_sequence(messages: List[BaseMessage]) -> bool:
                 j += 1
             
             if found_responses != tool_call_ids:
-                print(f"Validation failed: Missing tool responses for {tool_call_ids - found_responses}")
+                logger.debug("Validation failed: Missing tool responses for %s", tool_call_ids - found_responses)
                 return False
     
     return True
 
 
+def _complete_tool_response_indexes(messages: List[BaseMessage], end: int) -> Set[int]:
+    """
+    Find the ToolMessages up to index end that complete a tool call sequence.
+    
+    A ToolMessage at index i completes one when the ToolMessages since the
+    nearest preceding AIMessage with tool calls answer all of its calls.
+    
+    Args:
+        messages: List of BaseMessage objects
+        end: Last index to consider
+        
+    Returns:
+        Set[int]: Indexes of the completing ToolMessages
+    """
+    complete = set()
+    tool_call_ids = None
+    found_responses = set()
+    
+    for i in range(end + 1):
+        message = messages[i]
+        if isinstance(message, AIMessage) and message.tool_calls:
+            tool_call_ids = {tc['id'] for tc in message.tool_calls}
+            found_responses = set()
+        elif isinstance(message, ToolMessage) and tool_call_ids is not None:
+            if message.tool_call_id in tool_call_ids:
+                found_responses.add(message.tool_call_id)
+            if found_responses == tool_call_ids:
+                complete.add(i)
+    
+    return complete
+
+
 def get_last_complete_conversation_turn(messages: List[BaseMessage]) -> List[BaseMessage]:
     """
     Get messages up to the last complete conversation turn.
@@ -134,7 +268,11 @@ def get_last_complete_conversation_turn(messages: List[BaseMessage]) -> List[Bas
     if not messages:
         return messages
     
-    # Work backwards to find the last complete turn
+    # Work backwards to find the last complete turn. Which ToolMessages complete
+    # a tool call sequence is worked out in one forward pass, and only if the
+    # walk reaches a ToolMessage before a HumanMessage or final AIMessage.
+    complete_tool_responses = None
+    
     for i in range(len(messages) - 1, -1, -1):
         current_message = messages[i]
         
@@ -143,29 +281,15 @@ def get_last_complete_conversation_turn(messages: List[BaseMessage]) -> List[Bas
             return messages[:i+1]
         
         # If we find an AIMessage without tool calls, this is a complete response
-        if isinstance(current_message, AIMessage) and (not hasattr(current_message, 'tool_calls') or not current_message.tool_calls):
+        if isinstance(current_message, AIMessage) and not current_message.tool_calls:
             return messages[:i+1]
         
-        # If we find a ToolMessage, look for the corresponding AIMessage
+        # If we find a ToolMessage, check if it completes its tool call sequence
         if isinstance(current_message, ToolMessage):
-            # Find the AIMessage that initiated this tool call
-            for j in range(i - 1, -1, -1):
-                if isinstance(messages[j], AIMessage) and hasattr(messages[j], 'tool_calls') and messages[j].tool_calls:
-                    # Check if this tool call sequence is complete
-                    ai_msg = messages[j]
-                    tool_call_ids = {tc['id'] for tc in ai_msg.tool_calls}
-                    
-                    # Count responses between j+1 and i+1
-                    found_responses = set()
-                    for k in range(j + 1, i + 1):
-                        if isinstance(messages[k], ToolMessage) and hasattr(messages[k], 'tool_call_id'):
-                            if messages[k].tool_call_id in tool_call_ids:
-                                found_responses.add(messages[k].tool_call_id)
-                    
-                    if found_responses == tool_call_ids:
-                        # Complete tool sequence found
-                        return messages[:i+1]
-                    break
+            if complete_tool_responses is None:
+                complete_tool_responses = _complete_tool_response_indexes(messages, i)
+            if i in complete_tool_responses:
+                return messages[:i+1]
     
     # If no complete turn found, return empty list or first message only
-    return messages[:1] if messages else []
\ No newline at end of file
+    return messages[:1] if messages else []
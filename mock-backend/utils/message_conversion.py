@@ -1,12 +1,13 @@
 
-import urllib
+import urllib.parse
 
 def decode_file_attachment(data_url: str) -> dict:
     """Decode base64 data URL to dictionary with mimetype, base64data, filename."""
     if not data_url.startswith("data:"):
         raise ValueError("Invalid data URL format")
 
-    parts = data_url.split(",")
+    # At most header, base64 payload and an optional filename part
+    parts = data_url.split(",", 2)
     if len(parts) < 2:
         raise ValueError("Invalid data URL format")
 
@@ -14,9 +15,10 @@ def decode_file_attachment(data_url: str) -> dict:
     base64data = parts[1]
 
     # Parse mimetype from header
-    if ":" not in header or ";" not in header.split(":", 1)[1]:
+    _, colon, rest = header.partition(":")
+    mimetype, semicolon, _ = rest.partition(";")
+    if not colon or not semicolon:
         raise ValueError("Invalid header format")
-    mimetype = header.split(":", 1)[1].split(";", 1)[0]
 
     filename = None
     if len(parts) > 2:
@@ -33,6 +35,10 @@ def decode_file_attachment(data_url: str) -> dict:
 
 def from_assistant_ui_contents_to_langgraph_contents(message: list[any]) -> dict:
     """Convert an Assistant UI message to a Langgraph message."""
+    # Fast path for the common case of a single text part
+    if len(message) == 1 and message[0].get("type") == "text":
+        return [{"type": "text", "text": message[0].get("text", "")}]
+
     langgraph_contents = []
 
     for content in message:
@@ -1,104 +1,171 @@
-import json
-import uuid
-from langchain_core.messages import AIMessageChunk, AIMessage, ToolMessage, HumanMessage
+import time
+import orjson
+import itertools
+import asyncio
+import logging
+from functools import lru_cache
+from dataclasses import dataclass, field
+from langchain_core.messages import AIMessageChunk, AIMessage, ToolMessage, HumanMessage, BaseMessage
 
 from langgraph.graph.state import CompiledStateGraph
 
-from typing import List
+from typing import Callable, Dict, Iterator, List, Optional
 
-def generate_stream(graph: CompiledStateGraph, input_message: List[HumanMessage], conversation_id: str):
+logger = logging.getLogger(__name__)
+
+# Stream message and fallback tool call ids only need to be unique, not
+# unpredictable, so they come from the clock and a counter instead of uuid4
+_stream_id_counter = itertools.count()
+
+def _new_stream_id(prefix: str) -> str:
+    """Build a unique id for a stream message or tool call."""
+    return f"{prefix}-{time.time_ns()}-{next(_stream_id_counter)}"
+
+def _frame(code: bytes, obj) -> bytes:
+    """Encode one data stream frame as bytes, which Starlette sends without re-encoding."""
+    return code + b":" + orjson.dumps(obj) + b"\n"
+
+@dataclass
+class StreamState:
+    """State carried across the messages of one stream."""
+    tool_calls: Dict[str, dict] = field(default_factory=dict)
+    current_message_tool_calls: List[str] = field(default_factory=list)  # Track tool calls for the current message
+    accumulated_text: str = ""
+
+@lru_cache(maxsize=1)
+def _get_token_encoding():
+    """Load the tokenizer once. Returns None if it is unavailable (e.g. offline)."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning("Token encoding unavailable, falling back to word count: %s", e)
+        return None
+
+def count_tokens(text: str) -> int:
+    """Count the tokens in text, or its words if no tokenizer can be loaded."""
+    encoding = _get_token_encoding()
+    if encoding is None:
+        return len(text.split())
+    return len(encoding.encode(text))
+
+def _emit_tool_message(msg: ToolMessage, state: StreamState) -> Iterator[bytes]:
+    # Handle tool results - ToolCallResult (a:)
+    tool_call_id = msg.tool_call_id
+    yield _frame(b"a", {'toolCallId': tool_call_id, 'result': msg.content})
+
+def _emit_ai_message(msg: AIMessage, state: StreamState) -> Iterator[bytes]:
+    # Handle text content - TextDelta (0:)
+    if msg.content:
+        # Send text delta - properly escape the content
+        content = str(msg.content)
+        yield _frame(b"0", content)
+        state.accumulated_text += content
+
+    # Handle tool calls - Reset current message tool calls and rebuild
+    if msg.tool_calls:
+        logger.debug("Received %s tool_calls", len(msg.tool_calls))
+        # Check if this message has any real tool calls (not empty ones)
+        has_real_tool_calls = any(tool_call.get('name', '') != "" for tool_call in msg.tool_calls)
+        
+        # Only clear if we have real tool calls
+        if has_real_tool_calls:
+            state.current_message_tool_calls = []
+        
+        for tool_call in msg.tool_calls:
+            tool_call_id = tool_call['id'] if 'id' in tool_call else _new_stream_id("call")
+            tool_name = tool_call.get('name', '')
+            logger.debug("Tool call - id=%s, name=%s", tool_call_id, tool_name)
+
+            if tool_name != "":
+                # Add to current message tool calls list (maintains order)
+                state.current_message_tool_calls.append(tool_call_id)
+                
+                # Only initialize if this is a new tool call
+                if tool_call_id not in state.tool_calls:
+                    state.tool_calls[tool_call_id] = {"name": tool_name, "args": ""}
+                    
+                    # Send StartToolCall (b:)
+                    yield _frame(b"b", {'toolCallId': tool_call_id, 'toolName': tool_name})
+            else:
+                logger.debug("Skipping empty tool call")
+        
+        logger.debug("current_message_tool_calls after processing: %s", state.current_message_tool_calls)
+    
+    # Handle streaming tool call chunks (only AIMessageChunk carries them)
+    tool_call_chunks = getattr(msg, 'tool_call_chunks', None)
+    if tool_call_chunks:
+        logger.debug("Received %s tool_call_chunks", len(tool_call_chunks))
+        logger.debug("current_message_tool_calls at chunk time: %s", state.current_message_tool_calls)
+        for chunk in tool_call_chunks:
+            logger.debug("Full chunk: %s", chunk)
+            args_chunk = chunk.get("args", "")
+            chunk_index = chunk.get("index", 0)
+            logger.debug("args_chunk='%s', chunk_index=%s, len(current_message_tool_calls)=%s", args_chunk, chunk_index, len(state.current_message_tool_calls))
+            
+            # Use the current message's tool call list to map index to tool_call_id
+            tool_call_id = None
+            if chunk_index < len(state.current_message_tool_calls):
+                tool_call_id = state.current_message_tool_calls[chunk_index]
+                logger.debug("Mapped chunk_index %s to tool_call_id: %s", chunk_index, tool_call_id)
+            else:
+                logger.debug("WARNING - chunk_index %s >= len(current_message_tool_calls) %s", chunk_index, len(state.current_message_tool_calls))
+            
+            # Accumulate args and send ToolCallArgsTextDelta (c:)
+            if tool_call_id and tool_call_id in state.tool_calls and args_chunk:
+                state.tool_calls[tool_call_id]["args"] += args_chunk
+                logger.debug("Accumulating args for %s, total so far: %s chars", tool_call_id, len(state.tool_calls[tool_call_id]['args']))
+                yield _frame(b"c", {'toolCallId': tool_call_id, 'argsTextDelta': args_chunk})
+            else:
+                logger.debug("Skipping chunk - tool_call_id=%s, in tool_calls=%s, has args_chunk=%s", tool_call_id, tool_call_id in state.tool_calls if tool_call_id else False, bool(args_chunk))
+
+MessageHandler = Callable[[BaseMessage, StreamState], Iterator[bytes]]
+
+# Handlers keyed by exact message type, so each streamed message costs one
+# dict lookup. Subclasses are resolved through the MRO once and remembered.
+_MESSAGE_HANDLERS: Dict[type, Optional[MessageHandler]] = {
+    ToolMessage: _emit_tool_message,
+    AIMessageChunk: _emit_ai_message,
+    AIMessage: _emit_ai_message,
+}
+
+def _get_message_handler(message_type: type) -> Optional[MessageHandler]:
+    """Return the handler for a message type, or None if it is not streamed."""
+    try:
+        return _MESSAGE_HANDLERS[message_type]
+    except KeyError:
+        handler = next((_MESSAGE_HANDLERS[base] for base in message_type.__mro__ if base in _MESSAGE_HANDLERS), None)
+        _MESSAGE_HANDLERS[message_type] = handler
+        return handler
+
+async def generate_stream(graph: CompiledStateGraph, input_message: List[HumanMessage], conversation_id: str, userid: str | None = None):
     # Generate unique message ID
-    message_id = str(uuid.uuid4())
+    message_id = _new_stream_id("m")
     
     # Send StartStep (f:) - Start of message processing
-    yield f"f:{json.dumps({'messageId': message_id})}\n"
+    yield _frame(b"f", {'messageId': message_id})
     
-    tool_calls = {}
-    current_message_tool_calls = []  # Track tool calls for the current message
-    accumulated_text = ""
-    token_count = 0
+    state = StreamState()
 
     try:
-        for msg, metadata in graph.stream(
+        async for msg, metadata in graph.astream(
             {"messages": input_message},
-            config={"configurable": {"thread_id": conversation_id}},
+            config={"configurable": {"thread_id": conversation_id, "userid": userid}},
             stream_mode="messages",
         ):
-            if isinstance(msg, ToolMessage):
-                # Handle tool results - ToolCallResult (a:)
-                tool_call_id = msg.tool_call_id
-                yield f"a:{json.dumps({'toolCallId': tool_call_id, 'result': msg.content})}\n"
-
-            elif isinstance(msg, AIMessageChunk) or isinstance(msg, AIMessage):
-                # Handle text content - TextDelta (0:)
-                if msg.content:
-                    # Send text delta - properly escape the content
-                    content = str(msg.content)
-                    yield f"0:{json.dumps(content)}\n"
-                    accumulated_text += content
-                    token_count += len(content.split())
-
-                # Handle tool calls - Reset current message tool calls and rebuild
-                if hasattr(msg, 'tool_calls') and msg.tool_calls:
-                    print(f"DEBUG: Received {len(msg.tool_calls)} tool_calls")
-                    # Check if this message has any real tool calls (not empty ones)
-                    has_real_tool_calls = any(tool_call.get('name', '') != "" for tool_call in msg.tool_calls)
-                    
-                    # Only clear if we have real tool calls
-                    if has_real_tool_calls:
-                        current_message_tool_calls = []
-                    
-                    for tool_call in msg.tool_calls:
-                        tool_call_id = tool_call.get('id', str(uuid.uuid4()))
-                        tool_name = tool_call.get('name', '')
-                        print(f"DEBUG: Tool call - id={tool_call_id}, name={tool_name}")
-
-                        if tool_name != "":
-                            # Add to current message tool calls list (maintains order)
-                            current_message_tool_calls.append(tool_call_id)
-                            
-                            # Only initialize if this is a new tool call
-                            if tool_call_id not in tool_calls:
-                                tool_calls[tool_call_id] = {"name": tool_name, "args": ""}
-                                
-                                # Send StartToolCall (b:)
-                                yield f"b:{json.dumps({'toolCallId': tool_call_id, 'toolName': tool_name})}\n"
-                        else:
-                            print(f"DEBUG: Skipping empty tool call")
-                    
-                    print(f"DEBUG: current_message_tool_calls after processing: {current_message_tool_calls}")
-                
-                # Handle streaming tool call chunks
-                if hasattr(msg, 'tool_call_chunks') and msg.tool_call_chunks:
-                    print(f"DEBUG: Received {len(msg.tool_call_chunks)} tool_call_chunks")
-                    print(f"DEBUG: current_message_tool_calls at chunk time: {current_message_tool_calls}")
-                    for chunk in msg.tool_call_chunks:
-                        print(f"DEBUG: Full chunk: {chunk}")
-                        args_chunk = chunk.get("args", "")
-                        chunk_index = chunk.get("index", 0)
-                        print(f"DEBUG: args_chunk='{args_chunk}', chunk_index={chunk_index}, len(current_message_tool_calls)={len(current_message_tool_calls)}")
-                        
-                        # Use the current message's tool call list to map index to tool_call_id
-                        tool_call_id = None
-                        if chunk_index < len(current_message_tool_calls):
-                            tool_call_id = current_message_tool_calls[chunk_index]
-                            print(f"DEBUG: Mapped chunk_index {chunk_index} to tool_call_id: {tool_call_id}")
-                        else:
-                            print(f"DEBUG: WARNING - chunk_index {chunk_index} >= len(current_message_tool_calls) {len(current_message_tool_calls)}")
-                        
-                        # Accumulate args and send ToolCallArgsTextDelta (c:)
-                        if tool_call_id and tool_call_id in tool_calls and args_chunk:
-                            tool_calls[tool_call_id]["args"] += args_chunk
-                            print(f"DEBUG: Accumulating args for {tool_call_id}, total so far: {len(tool_calls[tool_call_id]['args'])} chars")
-                            yield f"c:{json.dumps({'toolCallId': tool_call_id, 'argsTextDelta': args_chunk})}\n"
-                        else:
-                            print(f"DEBUG: Skipping chunk - tool_call_id={tool_call_id}, in tool_calls={tool_call_id in tool_calls if tool_call_id else False}, has args_chunk={bool(args_chunk)}")
-                        
+            handler = _get_message_handler(type(msg))
+            if handler is not None:
+                for line in handler(msg, state):
+                    yield line
+
+        # Count tokens once over the whole text rather than per delta. The
+        # first call may load the encoding, so keep it off the event loop.
+        token_count = await asyncio.to_thread(count_tokens, state.accumulated_text)
 
         # Send FinishMessage (d:) with usage stats
-        yield f"d:{json.dumps({'finishReason': 'stop', 'usage': {'promptTokens': token_count, 'completionTokens': token_count}})}\n"
+        yield _frame(b"d", {'finishReason': 'stop', 'usage': {'promptTokens': token_count, 'completionTokens': token_count}})
         
     except Exception as e:
         # Send Error (3:)
         error_message = str(e)
-        yield f"3:{json.dumps(error_message)}\n"
\ No newline at end of file
+        yield _frame(b"3", error_message)